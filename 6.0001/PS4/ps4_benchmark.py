@@ -0,0 +1,281 @@
+# Benchmarks for the PS4 ciphers
+
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import ps4_cipher
+import ps4_words
+from ps4b import (WORDLIST_FILENAME, CiphertextMessage, PlaintextMessage,
+                  decrypt_messages, decrypt_stream, get_story_string,
+                  is_word, load_words)
+
+# Corpus sizes in MB for the cipher throughput benchmark
+CIPHER_SIZES = [1, 16, 64]
+# The character-by-character cipher is only run up to this size
+LEGACY_CIPHER_MAX_SIZE = 1
+CIPHER_SHIFT = 7
+# Corpus sizes in MB for the decrypt benchmark on long messages
+DECRYPT_SIZES = [1, 16]
+# File sizes in MB for the streaming benchmark
+STREAM_SIZES = [16, 128, 1024]
+# Whole files are only read into a CiphertextMessage up to this size
+IN_MEMORY_MAX_SIZE = 128
+# Short messages decrypted by the batch benchmark, and the worker counts
+BATCH_TEXTS = 20000
+BATCH_WORKERS = [1, 2, 4]
+# Messages decrypted one CiphertextMessage at a time with the old code
+LEGACY_BATCH_TEXTS = 50
+
+class LegacyCiphertextMessage(CiphertextMessage):
+    '''
+    CiphertextMessage as it was before the word list registry: every
+    message parses words.txt into a list, and get_valid_words copies it.
+    '''
+    def __init__(self, text):
+        self.message_text = text
+        self.valid_words = load_words(WORDLIST_FILENAME)
+
+    def get_valid_words(self):
+        return self.valid_words[:]
+
+    def decrypt_message(self):
+        return exhaustive_decrypt(self)
+
+def exhaustive_decrypt(message):
+    '''
+    decrypt_message as it was before the frequency ranking: the whole
+    message is shifted and its words counted for all 26 shifts.
+    '''
+    max_valid_words = -1
+    for decrypt_shift in range(26):
+        decrypted_message = message.apply_shift(decrypt_shift)
+        decrypted_words = str.split(decrypted_message," ")
+        n_valid_words = 0
+        for word in decrypted_words:
+            if is_word(message.get_valid_words(),word):
+                n_valid_words += 1
+        if n_valid_words >= max_valid_words:
+            max_valid_words = n_valid_words
+            best_shift_message = (decrypt_shift,decrypted_message)
+    return best_shift_message
+
+def legacy_apply_dict(text, dic):
+    '''
+    apply_shift and apply_transpose as they were before ps4_cipher: the
+    output is built one character at a time.
+    '''
+    shifted_message = ""
+    for letter in text:
+        if dic.get(letter,-1) == -1:
+            shifted_message += letter
+        else:
+            shifted_message += dic[letter]
+    return shifted_message
+
+def make_corpus(size_mb):
+    '''
+    Returns: about size_mb megabytes of English text (string), made of
+    copies of story2_original.txt
+    '''
+    with open("story2_original.txt", "r") as in_file:
+        story = in_file.read() + "\n"
+    return story * (size_mb * 2**20 // len(story) + 1)
+
+def time_call(function, *args):
+    '''
+    Returns: a tuple of the result of function(*args) and the seconds it
+    took
+    '''
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def decrypt(message_class, text):
+    return message_class(text).decrypt_message()
+
+def run_word_list_benchmark():
+    print("Loading", WORDLIST_FILENAME)
+    ps4_words.clear_word_sets()
+    _, parse = time_call(ps4_words.load_word_set, WORDLIST_FILENAME, False)
+    ps4_words.clear_word_sets()
+    ps4_words.load_word_set(WORDLIST_FILENAME)
+    ps4_words.clear_word_sets()
+    _, cached = time_call(ps4_words.load_word_set, WORDLIST_FILENAME)
+    _, loaded = time_call(ps4_words.load_word_set, WORDLIST_FILENAME)
+    print("{:>24} {:>10.5f} s".format("parse", parse))
+    print("{:>24} {:>10.5f} s".format("pickled cache", cached))
+    print("{:>24} {:>10.5f} s".format("already loaded", loaded))
+
+def run_decrypt_benchmark():
+    story = get_story_string()
+    print("Decrypting story.txt")
+    legacy, legacy_seconds = time_call(decrypt, LegacyCiphertextMessage,
+                                       story)
+    shared, seconds = time_call(decrypt, CiphertextMessage, story)
+    assert legacy == shared
+    print("{:>24} {:>10.5f} s".format("list, copied per word",
+                                      legacy_seconds))
+    print("{:>24} {:>10.5f} s".format("shared frozenset, ranked",
+                                      seconds))
+    print("{:>24} {:>10.1f} x".format("speedup", legacy_seconds / seconds))
+
+def run_cipher_benchmark():
+    print("Caesar cipher throughput, MB/s")
+    print("{:>6} {:>12} {:>10} {:>10}".format("MB", "engine", "encrypt",
+                                              "decrypt"))
+    encrypt_dict = ps4_cipher.build_shift_dict(CIPHER_SHIFT)
+    decrypt_dict = ps4_cipher.build_shift_dict(26 - CIPHER_SHIFT)
+    for size_mb in CIPHER_SIZES:
+        text = make_corpus(size_mb)
+        data = text.encode("ascii")
+        megabytes = len(data) / 2**20
+        engines = []
+        if size_mb <= LEGACY_CIPHER_MAX_SIZE:
+            engines.append(("+= per char", legacy_apply_dict, text,
+                            encrypt_dict, decrypt_dict))
+        engines.append(("str", ps4_cipher.apply_shift, text, CIPHER_SHIFT,
+                        26 - CIPHER_SHIFT))
+        engines.append(("bytes", ps4_cipher.apply_shift, data, CIPHER_SHIFT,
+                        26 - CIPHER_SHIFT))
+        for label, apply, plain, encrypt, decrypt in engines:
+            encrypted, encrypt_seconds = time_call(apply, plain, encrypt)
+            decrypted, decrypt_seconds = time_call(apply, encrypted, decrypt)
+            assert decrypted == plain
+            print("{:>6.0f} {:>12} {:>10.1f} {:>10.1f}".format(
+                megabytes, label, megabytes / encrypt_seconds,
+                megabytes / decrypt_seconds))
+            del encrypted, decrypted
+
+def run_long_decrypt_benchmark():
+    print("Decrypting long messages, seconds")
+    print("{:>6} {:>12} {:>12}".format("MB", "26 passes", "ranked"))
+    for size_mb in DECRYPT_SIZES:
+        text = PlaintextMessage(make_corpus(size_mb),
+                                CIPHER_SHIFT).get_message_text_encrypted()
+        message = CiphertextMessage(text)
+        every, every_seconds = time_call(exhaustive_decrypt, message)
+        ranked, ranked_seconds = time_call(message.decrypt_message)
+        assert every == ranked
+        print("{:>6.0f} {:>12.3f} {:>12.3f}".format(
+            len(text) / 2**20, every_seconds, ranked_seconds))
+        del text, message, every, ranked
+
+def write_encrypted_file(file_name, size_mb):
+    '''
+    Writes size_mb megabytes of English text encrypted with CIPHER_SHIFT
+    to file_name, one copy of the 1 MB corpus at a time.
+    '''
+    chunk = ps4_cipher.apply_shift(make_corpus(1)[:2**20].encode("ascii"),
+                                   CIPHER_SHIFT)
+    with open(file_name, "wb") as out_file:
+        for _ in range(size_mb):
+            out_file.write(chunk)
+
+def decrypt_whole_file(in_name, out_name):
+    with open(in_name, "r") as in_file:
+        shift, text = CiphertextMessage(in_file.read()).decrypt_message()
+    with open(out_name, "w") as out_file:
+        out_file.write(text)
+    return shift
+
+def decrypt_file_stream(in_name, out_name):
+    with open(in_name, "rb") as in_file, open(out_name, "wb") as out_file:
+        return decrypt_stream(in_file, out_file)
+
+def measure_in_child(connection, function, *args):
+    '''
+    Runs function(*args) and sends back its result, the seconds it took
+    and the peak resident memory of this (child) process in MB.
+    '''
+    result, seconds = time_call(function, *args)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    connection.send((result, seconds, peak))
+    connection.close()
+
+def measure_process(function, *args):
+    '''
+    Returns: a tuple of the result of function(*args), the seconds it
+    took and the peak memory in MB of a fresh process running it
+    '''
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=measure_in_child,
+                                      args=(sender, function) + args)
+    process.start()
+    sender.close()
+    measurement = receiver.recv()
+    process.join()
+    return measurement
+
+def run_stream_benchmark():
+    print("Decrypting files, peak memory of the decrypting process")
+    print("{:>6} {:>12} {:>10} {:>10}".format("MB", "reader", "MB/s",
+                                              "peak MB"))
+    # Load the word list before forking, as a long running process would
+    ps4_words.load_word_set(WORDLIST_FILENAME)
+    with tempfile.TemporaryDirectory() as directory:
+        in_name = os.path.join(directory, "encrypted.txt")
+        out_name = os.path.join(directory, "decrypted.txt")
+        for size_mb in STREAM_SIZES:
+            write_encrypted_file(in_name, size_mb)
+            readers = [("stream", decrypt_file_stream)]
+            if size_mb <= IN_MEMORY_MAX_SIZE:
+                readers.insert(0, ("whole file", decrypt_whole_file))
+            for label, reader in readers:
+                shift, seconds, peak = measure_process(reader, in_name,
+                                                       out_name)
+                assert shift == 26 - CIPHER_SHIFT
+                assert os.path.getsize(out_name) == size_mb * 2**20
+                print("{:>6} {:>12} {:>10.1f} {:>10.1f}".format(
+                    size_mb, label, size_mb / seconds, peak))
+
+def make_short_messages(count, seed=0):
+    '''
+    Returns: a list of count texts of 5 to 30 words of
+    story2_original.txt, each encrypted with a random shift
+    '''
+    with open("story2_original.txt", "r") as in_file:
+        words = in_file.read().split(" ")
+    generator = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        length = generator.randint(5, 30)
+        start = generator.randrange(len(words) - length)
+        texts.append(PlaintextMessage(" ".join(words[start:start + length]),
+                                      generator.randrange(26))
+                     .get_message_text_encrypted())
+    return texts
+
+def run_batch_benchmark():
+    print("Decrypting short messages, {} CPUs".format(os.cpu_count()))
+    print("{:>8} {:>22} {:>12}".format("messages", "decrypter",
+                                       "messages/s"))
+    texts = make_short_messages(BATCH_TEXTS)
+    legacy_texts = texts[:LEGACY_BATCH_TEXTS]
+    legacy, seconds = time_call(lambda: [decrypt(LegacyCiphertextMessage,
+                                                 text)
+                                         for text in legacy_texts])
+    print("{:>8} {:>22} {:>12.1f}".format(len(legacy_texts),
+                                          "old, one at a time",
+                                          len(legacy_texts) / seconds))
+    expected, seconds = time_call(lambda: [decrypt(CiphertextMessage, text)
+                                           for text in texts])
+    print("{:>8} {:>22} {:>12.1f}".format(len(texts), "one at a time",
+                                          len(texts) / seconds))
+    for workers in BATCH_WORKERS:
+        results, seconds = time_call(lambda: list(decrypt_messages(
+            texts, workers)))
+        assert results == expected
+        print("{:>8} {:>22} {:>12.1f}".format(
+            len(texts), "decrypt_messages, {}".format(workers),
+            len(texts) / seconds))
+
+if __name__ == '__main__':
+    run_word_list_benchmark()
+    run_decrypt_benchmark()
+    run_long_decrypt_benchmark()
+    run_stream_benchmark()
+    run_batch_benchmark()
+    run_cipher_benchmark()
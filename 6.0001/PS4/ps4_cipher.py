@@ -0,0 +1,166 @@
+# Translation tables for the PS4 ciphers
+
+import collections
+import functools
+import string
+
+VOWELS_LOWER = 'aeiou'
+VOWELS_UPPER = 'AEIOU'
+
+# Relative frequency of each letter a..z in English text, in percent
+ENGLISH_LETTER_FREQUENCIES = (
+    8.167, 1.492, 2.782, 4.253, 12.702, 2.228, 2.015, 6.094, 6.966, 0.153,
+    0.772, 4.025, 2.406, 6.749, 7.507, 1.929, 0.095, 5.987, 6.327, 9.056,
+    2.758, 0.978, 2.360, 0.150, 1.974, 0.074)
+
+def build_shift_dict(shift):
+    '''
+    shift (integer): the amount by which to shift every letter of the
+    alphabet. 0 <= shift < 26
+
+    Returns: a dictionary mapping every uppercase and lowercase letter
+    (string) to the letter shifted down the alphabet by shift
+    '''
+    assert shift >= 0 and shift < 26, "Invalid shift value."
+    dic = {}
+    #Map lowercase letters
+    for i, letter in enumerate(string.ascii_lowercase):
+        dic[letter] = string.ascii_lowercase[(i+shift)%26]
+    #Map uppercase letters
+    for i, letter in enumerate(string.ascii_uppercase):
+        dic[letter] = string.ascii_uppercase[(i+shift)%26]
+    return dic
+
+def build_transpose_dict(vowels_permutation):
+    '''
+    vowels_permutation (string): a string containing a permutation of
+    vowels (a, e, i, o, u)
+
+    Returns: a dictionary mapping every uppercase and lowercase letter
+    (string) to itself, except for the vowels which are shuffled
+    according to vowels_permutation
+    '''
+    dic = {}
+    for letter in string.ascii_letters:
+        dic[letter] = letter
+    #Map vowels
+    for i, letter in enumerate(vowels_permutation):
+        dic[VOWELS_LOWER[i]] = letter.lower()
+        dic[VOWELS_UPPER[i]] = letter.upper()
+    return dic
+
+def compile_table(letter_dict):
+    '''
+    letter_dict (dict): a dictionary mapping letters (strings) to
+    letters (strings), such as a shift or transpose dictionary
+
+    Returns: a str.translate table applying letter_dict to a text and
+    keeping the characters it does not map
+    '''
+    return str.maketrans(letter_dict)
+
+def compile_bytes_table(letter_dict):
+    '''
+    letter_dict (dict): a dictionary mapping ASCII letters (strings) to
+    ASCII letters (strings)
+
+    Returns: a bytes.translate table applying letter_dict to ASCII bytes
+    and keeping the bytes it does not map
+    '''
+    return bytes.maketrans(''.join(letter_dict).encode('ascii'),
+                           ''.join(letter_dict.values()).encode('ascii'))
+
+@functools.lru_cache(maxsize=None)
+def shift_table(shift):
+    '''
+    Returns: the str.translate table of build_shift_dict(shift), built
+    once per shift
+    '''
+    return compile_table(build_shift_dict(shift))
+
+@functools.lru_cache(maxsize=None)
+def shift_bytes_table(shift):
+    '''
+    Returns: the bytes.translate table of build_shift_dict(shift), built
+    once per shift
+    '''
+    return compile_bytes_table(build_shift_dict(shift))
+
+@functools.lru_cache(maxsize=None)
+def transpose_table(vowels_permutation):
+    '''
+    Returns: the str.translate table of
+    build_transpose_dict(vowels_permutation), built once per permutation
+    '''
+    return compile_table(build_transpose_dict(vowels_permutation))
+
+@functools.lru_cache(maxsize=None)
+def transpose_bytes_table(vowels_permutation):
+    '''
+    Returns: the bytes.translate table of
+    build_transpose_dict(vowels_permutation), built once per permutation
+    '''
+    return compile_bytes_table(build_transpose_dict(vowels_permutation))
+
+def apply_shift(text, shift):
+    '''
+    text (string or bytes): the text to encrypt. Bytes must be ASCII
+    (or an ASCII-compatible encoding such as UTF-8).
+    shift (integer): 0 <= shift < 26
+
+    Returns: text, of the same type, with every letter shifted down the
+    alphabet by shift
+    '''
+    if isinstance(text, str):
+        return text.translate(shift_table(shift))
+    return text.translate(shift_bytes_table(shift))
+
+def apply_transpose(text, vowels_permutation):
+    '''
+    text (string or bytes): the text to encrypt. Bytes must be ASCII
+    (or an ASCII-compatible encoding such as UTF-8).
+    vowels_permutation (string): a permutation of the vowels
+
+    Returns: text, of the same type, with its vowels shuffled according
+    to vowels_permutation
+    '''
+    if isinstance(text, str):
+        return text.translate(transpose_table(vowels_permutation))
+    return text.translate(transpose_bytes_table(vowels_permutation))
+
+def letter_histogram(text):
+    '''
+    text (string): the text to count
+
+    Returns: a list of 26 integers, how many times each letter a..z
+    appears in text, ignoring capitalization
+    '''
+    counts = collections.Counter(text)
+    return [counts[lower] + counts[upper] for lower, upper in
+            zip(string.ascii_lowercase, string.ascii_uppercase)]
+
+def rank_shifts(histogram):
+    '''
+    Scores every shift by the chi-squared distance between the letters
+    the shift would produce and English letter frequencies. The score
+    only needs the histogram of the text, so the text is not shifted.
+
+    histogram (list): 26 letter counts, as returned by letter_histogram
+
+    Returns: a list of the 26 shifts (integers), from the one producing
+    the most English-like letters to the least
+    '''
+    total = sum(histogram)
+    if total == 0:
+        return list(range(26))
+    expected = [total * frequency / 100
+                for frequency in ENGLISH_LETTER_FREQUENCIES]
+    scores = []
+    for shift in range(26):
+        # Letter i of the text becomes letter (i + shift) % 26
+        score = 0.0
+        for i, count in enumerate(histogram):
+            letter_expected = expected[(i + shift) % 26]
+            score += (count - letter_expected) ** 2 / letter_expected
+        scores.append(score)
+    return sorted(range(26), key=scores.__getitem__)
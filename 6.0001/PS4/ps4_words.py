@@ -0,0 +1,91 @@
+# Word list registry shared by the PS4 ciphers
+
+import os
+import pickle
+import tempfile
+
+# Suffix of the cache file written next to a word list
+CACHE_SUFFIX = '.pickle'
+
+# dict of absolute file name -> (mtime_ns, size, frozenset of words)
+_word_sets = {}
+
+def _read_words(file_name):
+    with open(file_name, 'r') as in_file:
+        return frozenset(word.lower() for line in in_file
+                         for word in line.split())
+
+def _read_cache(cache_name, stamp):
+    '''
+    Returns the words stored in cache_name if they were read from a word
+    list with the given (mtime_ns, size) stamp, None otherwise.
+    '''
+    # A damaged cache can raise almost anything while unpickling, and is
+    # only a miss
+    try:
+        with open(cache_name, 'rb') as cache_file:
+            cached_stamp, words = pickle.load(cache_file)
+    except Exception:
+        return None
+    if cached_stamp != stamp or not isinstance(words, frozenset):
+        return None
+    return words
+
+def _write_cache(cache_name, stamp, words):
+    # The cache is only an optimization, so a read-only directory is fine.
+    # Each writer uses its own temporary file, so processes writing the
+    # cache at once never mix their pickles.
+    try:
+        handle, temp_name = tempfile.mkstemp(
+            dir=os.path.dirname(cache_name),
+            prefix=os.path.basename(cache_name) + '.')
+    except OSError:
+        return
+    try:
+        with os.fdopen(handle, 'wb') as cache_file:
+            pickle.dump((stamp, words), cache_file,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_name, cache_name)
+    except OSError:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+
+def load_word_set(file_name, use_cache=True):
+    '''
+    Loads a word list once per process. Later calls return the same
+    frozenset for as long as the file is unchanged, and the words are
+    also pickled next to the file so that the next process does not
+    parse it again.
+
+    file_name (string): the name of the file containing the list of
+    words to load
+    use_cache (bool): whether to read and write the pickled cache,
+    OPTIONAL
+
+    Returns: a frozenset of valid words. Words are strings of lowercase
+    letters.
+    '''
+    path = os.path.abspath(file_name)
+    status = os.stat(path)
+    stamp = (status.st_mtime_ns, status.st_size)
+    entry = _word_sets.get(path)
+    if entry is not None and entry[:2] == stamp:
+        return entry[2]
+    words = None
+    if use_cache:
+        words = _read_cache(path + CACHE_SUFFIX, stamp)
+    if words is None:
+        words = _read_words(path)
+        if use_cache:
+            _write_cache(path + CACHE_SUFFIX, stamp, words)
+    _word_sets[path] = stamp + (words,)
+    return words
+
+def clear_word_sets():
+    '''
+    Forgets the word lists loaded by this process. The pickled caches
+    are kept.
+    '''
+    _word_sets.clear()
@@ -1,8 +1,26 @@
 #Caesar Cipher
 
-import string
+import collections
+import io
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from ps4_cipher import apply_shift, build_shift_dict, letter_histogram, \
+     rank_shifts, shift_table
+from ps4_words import load_word_set
 
 WORDLIST_FILENAME = 'words.txt'
+# Number of best ranked shifts checked against the word list
+TOP_SHIFTS = 3
+# Samples with fewer words than this have every shift checked, since
+# several shifts may turn all of their words into real ones
+FEW_WORDS = 10
+# Number of characters at the start of a message used to find its shift
+SAMPLE_SIZE = 2**16
+# Number of characters read and shifted at a time by the stream functions
+CHUNK_SIZE = 2**20
+# Number of texts sent to a worker process at a time by decrypt_messages
+BATCH_SIZE = 64
 
 def load_words(file_name):
     '''
@@ -27,7 +45,8 @@ def is_word(word_list, word):
     Determines if word is a valid word, ignoring capitalization and
     punctuation
 
-    word_list (list): list of words in the dictionary.
+    word_list (frozenset or list): words in the dictionary. Lookups in
+    a frozenset take constant time.
     word (string): a possible word.
     
     Returns: True if word is in word_list, False otherwise
@@ -54,11 +73,11 @@ class Message(object):
 
         a Message object has two attributes:
             self.message_text (string, determined by input text)
-            self.valid_words (list, determined using helper function
-            load_words)
+            self.valid_words (frozenset, shared by all messages and
+            determined using helper function load_word_set)
         '''
         self.message_text = text
-        self.valid_words = load_words(WORDLIST_FILENAME)
+        self.valid_words = load_word_set(WORDLIST_FILENAME)
 
     def get_message_text(self):
         '''
@@ -70,13 +89,13 @@ class Message(object):
 
     def get_valid_words(self):
         '''
-        Used to safely access a copy of self.valid_words outside of the
-        class. This helps you avoid accidentally mutating class
-        attributes.
+        Used to safely access self.valid_words outside of the class. The
+        words are a frozenset, so they cannot be mutated and need no
+        copy.
         
-        Returns: a COPY of self.valid_words
+        Returns: self.valid_words
         '''
-        return self.valid_words[:]
+        return self.valid_words
 
     def build_shift_dict(self, shift):
         '''
@@ -92,16 +111,8 @@ class Message(object):
         Returns: a dictionary mapping a letter (string) to another
         letter (string). 
         '''
-        assert shift >= 0 and shift < 26, "Invalid shift value."
-        dic = {}
-        #Map lowercase letters
-        for i, letter in enumerate(string.ascii_lowercase):
-            dic[letter] = string.ascii_lowercase[(i+shift)%26]
-        #Map uppercase letters
-        for i, letter in enumerate(string.ascii_uppercase):
-            dic[letter] = string.ascii_uppercase[(i+shift)%26]
-        return dic
-            
+        return build_shift_dict(shift)
+
     def apply_shift(self, shift):
         '''
         Applies the Caesar Cipher to self.message_text with the input
@@ -112,18 +123,14 @@ class Message(object):
         shift (integer): the shift with which to encrypt the message.
         0 <= shift < 26
 
+        The shift dictionary is compiled once per shift into a
+        str.translate table (see ps4_cipher).
+
         Returns: the message text (string) in which every character is
         shifted down the alphabet by the input shift
         '''
         assert shift >= 0 and shift < 26, "Invalid shift value."
-        dic = self.build_shift_dict(shift)
-        shifted_message = ""
-        for letter in self.get_message_text():
-            if dic.get(letter,-1) == -1:
-                shifted_message += letter
-            else:
-                shifted_message += dic[letter]
-        return shifted_message
+        return self.get_message_text().translate(shift_table(shift))
 
 class PlaintextMessage(Message):
     def __init__(self, text, shift):
@@ -136,8 +143,8 @@ class PlaintextMessage(Message):
         A PlaintextMessage object inherits from Message and has five
         attributes:
             self.message_text (string, determined by input text)
-            self.valid_words (list, determined using helper function
-            load_words)
+            self.valid_words (frozenset, shared by all messages and
+            determined using helper function load_word_set)
             self.shift (integer, determined by input shift)
             self.encryption_dict (dictionary, built using shift)
             self.message_text_encrypted (string, created using shift)
@@ -199,12 +206,43 @@ class CiphertextMessage(Message):
 
         a CiphertextMessage object has two attributes:
             self.message_text (string, determined by input text)
-            self.valid_words (list, determined using helper function
-            load_words)
+            self.valid_words (frozenset, shared by all messages and
+            determined using helper function load_word_set)
         '''
         Message.__init__(self,text)
 
-    def decrypt_message(self):
+    def count_valid_words(self, text):
+        '''
+        text (string): a text whose words are separated by spaces
+
+        Returns: the number of words of text (integer) that are in
+        self.valid_words
+        '''
+        valid_words = self.get_valid_words()
+        n_valid_words = 0
+        for word in text.split(" "):
+            if is_word(valid_words, word):
+                n_valid_words += 1
+        return n_valid_words
+
+    def _count_valid_words_up_to(self, text, needed):
+        '''
+        Like count_valid_words, but stops counting, and returns less
+        than needed, as soon as text cannot have needed valid words.
+        '''
+        valid_words = self.get_valid_words()
+        words = text.split(" ")
+        n_left = len(words)
+        n_valid_words = 0
+        for word in words:
+            if n_valid_words + n_left < needed:
+                break
+            n_left -= 1
+            if is_word(valid_words, word):
+                n_valid_words += 1
+        return n_valid_words
+
+    def decrypt_message(self, top_k = TOP_SHIFTS, sample_size = SAMPLE_SIZE):
         '''
         Decrypt self.message_text by trying every possible shift value
         and find the "best" one. We will define "best" as the shift that
@@ -213,22 +251,221 @@ class CiphertextMessage(Message):
         shift value used to encrypt the message, then we would expect
         26 - s to be the best shift value for decrypting it.
 
+        Only the first sample_size characters are looked at. Their letter
+        histogram ranks the 26 shifts by how English the shifted letters
+        are, and the words are first counted for the top_k of them. The
+        other shifts are only skipped when the best of those turns every
+        word of the sample into a real one and the sample has at least
+        FEW_WORDS words, so the result is always that of trying every
+        shift. Otherwise each of them is counted until it can no longer
+        beat the best shift so far. Ties go to the larger shift. The
+        whole message is then shifted once.
+
+        top_k (integer): the number of ranked shifts to check, OPTIONAL
+        sample_size (integer): the number of characters to look at,
+        OPTIONAL
+
         Returns: a tuple of the best shift value used to decrypt the
         message and the decrypted message text using that shift value
         '''
-        max_valid_words = -1
-        for decrypt_shift in range(26):
-            decrypted_message = self.apply_shift(decrypt_shift)
-            decrypted_words = str.split(decrypted_message," ")
-            n_valid_words = 0
-            for word in decrypted_words:
-                if is_word(self.get_valid_words(),word):
-                    n_valid_words += 1        
-            if n_valid_words >= max_valid_words:
-                max_valid_words = n_valid_words
-                best_shift_message = (decrypt_shift,decrypted_message)
-        return best_shift_message
+        text = self.get_message_text()
+        sample = text[:sample_size]
+        if len(text) > sample_size:
+            # Drop the word cut by the end of the sample
+            sample = sample[:sample.rfind(" ") + 1]
+        # Empty strings between spaces are never valid words
+        n_words = sum(1 for word in sample.split(" ") if word)
+        ranked = rank_shifts(letter_histogram(sample))
+        # (number of valid words, shift) of the best shift so far
+        best = max((self.count_valid_words(
+            sample.translate(shift_table(decrypt_shift))), decrypt_shift)
+                   for decrypt_shift in ranked[:top_k])
+        if n_words < FEW_WORDS or best[0] < n_words:
+            for decrypt_shift in ranked[top_k:]:
+                # A smaller shift must have more valid words to win
+                needed = best[0] + (decrypt_shift < best[1])
+                n_valid_words = self._count_valid_words_up_to(
+                    sample.translate(shift_table(decrypt_shift)), needed)
+                if n_valid_words >= needed:
+                    best = (n_valid_words, decrypt_shift)
+        best_shift = best[1]
+        return (best_shift, self.apply_shift(best_shift))
+
+def encrypt_stream(in_file, out_file, shift, chunk_size = CHUNK_SIZE):
+    '''
+    Encrypts in_file into out_file like PlaintextMessage does a text,
+    but one chunk at a time, so memory use does not grow with the file.
+
+    in_file (file object): read until its end, in text or binary mode.
+    Binary files must be ASCII (or an ASCII-compatible encoding such as
+    UTF-8).
+    out_file (file object): written in the same mode as in_file
+    shift (integer): the shift with which to encrypt the file.
+    0 <= shift < 26
+    chunk_size (integer): the number of characters (or bytes) shifted
+    at a time, OPTIONAL
+
+    Returns: the number of characters (or bytes) written
+    '''
+    assert shift >= 0 and shift < 26, "Invalid shift value."
+    size = 0
+    while True:
+        chunk = in_file.read(chunk_size)
+        if not chunk:
+            return size
+        out_file.write(apply_shift(chunk, shift))
+        size += len(chunk)
+
+def decrypt_stream(in_file, out_file, sample_size = SAMPLE_SIZE,
+                   chunk_size = CHUNK_SIZE):
+    '''
+    Decrypts in_file into out_file like CiphertextMessage does a text,
+    but one chunk at a time. The shift is found from the first
+    sample_size characters only, and then applied to the whole file.
+
+    in_file (file object): read until its end, in text or binary mode,
+    as for encrypt_stream
+    out_file (file object): written in the same mode as in_file
+    sample_size (integer): the number of characters (or bytes) used to
+    find the shift, OPTIONAL
+    chunk_size (integer): the number of characters (or bytes) shifted
+    at a time, OPTIONAL
+
+    Returns: the shift value (integer) used to decrypt the file
+    '''
+    sample = in_file.read(sample_size)
+    if isinstance(sample, str):
+        sample_text = sample
+    else:
+        # Only the ASCII letters matter, and latin-1 decodes any bytes
+        sample_text = sample.decode("latin-1")
+    shift = CiphertextMessage(sample_text).decrypt_message(
+        sample_size = sample_size)[0]
+    out_file.write(apply_shift(sample, shift))
+    encrypt_stream(in_file, out_file, shift, chunk_size)
+    return shift
+
+def _init_decrypt_worker():
+    # Every message of this worker shares the one word set
+    load_word_set(WORDLIST_FILENAME)
+
+def _decrypt_batch(texts):
+    return [CiphertextMessage(text).decrypt_message() for text in texts]
+
+def decrypt_messages(texts, max_workers = None, batch_size = BATCH_SIZE):
+    '''
+    Decrypts many messages with a pool of worker processes, each of
+    which loads the word list once. The texts are sent to the workers in
+    batches of batch_size, and only a few batches per worker are read
+    ahead, so texts can be an endless stream.
+
+    texts (iterable): the texts (strings) to decrypt
+    max_workers (integer): the number of worker processes, OPTIONAL.
+    Defaults to os.cpu_count(). With 1, including by default on a
+    single CPU, the texts are decrypted in this process, which is faster
+    than one worker.
+    batch_size (integer): the number of texts per batch, OPTIONAL
+
+    The arguments are checked when decrypt_messages is called, not when
+    the first result is asked for.
+
+    Returns: an iterator over a tuple of the best shift value and the
+    decrypted text for every text, in the order of texts, as returned by
+    CiphertextMessage(text).decrypt_message()
+    '''
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    assert max_workers >= 1, "Invalid max_workers value."
+    assert batch_size >= 1, "Invalid batch_size value."
+    if max_workers == 1:
+        return (CiphertextMessage(text).decrypt_message() for text in texts)
+    return _decrypt_in_pool(iter(texts), max_workers, batch_size)
+
+def _decrypt_in_pool(texts, max_workers, batch_size):
+    with ProcessPoolExecutor(max_workers,
+                             initializer=_init_decrypt_worker) as executor:
+        pending = collections.deque()
+        max_pending = 2 * max_workers
+        while True:
+            while len(pending) < max_pending:
+                batch = [text for _, text in zip(range(batch_size), texts)]
+                if not batch:
+                    break
+                pending.append(executor.submit(_decrypt_batch, batch))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+def test_stream_round_trip(file_name, shift, chunk_size, sample_size,
+                           binary):
+    '''
+    Test for encrypt_stream and decrypt_stream: encrypts a file, in text
+    or binary mode, and decrypts the result, with chunks and a sample
+    small enough that words and the sample are cut between reads.
+
+    Returns: True if the decrypted text is the file and the shift found
+    undoes shift; False otherwise
+    '''
+    with open(file_name, "rb" if binary else "r") as in_file:
+        original = in_file.read()
+    new_file = io.BytesIO if binary else io.StringIO
+    with open(file_name, "rb" if binary else "r") as in_file:
+        encrypted = new_file()
+        encrypt_stream(in_file, encrypted, shift, chunk_size)
+    encrypted.seek(0)
+    decrypted = new_file()
+    found_shift = decrypt_stream(encrypted, decrypted, sample_size,
+                                 chunk_size)
+    print("Mode:", "binary" if binary else "text", "Chunk size:",
+          chunk_size, "Sample size:", sample_size)
+    print("Expected shift:", (26 - shift) % 26, "Actual shift:", found_shift)
+    if (found_shift == (26 - shift) % 26 and
+            decrypted.getvalue() == original and
+            encrypted.getvalue() == apply_shift(original, shift)):
+        print("Success!")
+        return True
+    else:
+        print("Fail!")
+        return False
+
+def test_short_messages(n_messages, seed):
+    '''
+    Test for CiphertextMessage.decrypt_message on messages of a few
+    random words, short ones and ones with rare letters, whose letters
+    often mislead the ranking of the shifts: compares its shift with the
+    one found by counting the words of every shift.
+
+    Returns: True if both shifts are the same for every message; False
+    otherwise
+    '''
+    rng = random.Random(seed)
+    words = sorted(load_word_set(WORDLIST_FILENAME))
+    short_words = [word for word in words if len(word) <= 3]
+    rare_words = [word for word in words
+                  if any(letter in word for letter in "jqxz")]
+    n_failed = 0
+    for _ in range(n_messages):
+        text = " ".join(rng.choice(rng.choice((short_words, rare_words)))
+                        for _ in range(rng.randint(1, FEW_WORDS + 2)))
+        message = CiphertextMessage(apply_shift(text, rng.randrange(26)))
+        expected_shift = max(range(26), key = lambda decrypt_shift: (
+            message.count_valid_words(message.apply_shift(decrypt_shift)),
+            decrypt_shift))
+        if message.decrypt_message()[0] != expected_shift:
+            n_failed += 1
+    print("Short messages:", n_messages, "Failed:", n_failed)
+    if n_failed == 0:
+        print("Success!")
+        return True
+    else:
+        print("Fail!")
+        return False
 
 if __name__ == '__main__':    
     cp = CiphertextMessage(get_story_string())
-    print(cp.decrypt_message())
\ No newline at end of file
+    print(cp.decrypt_message())
+
+    for binary in (False, True):
+        test_stream_round_trip("story2_original.txt", 5, 7, 200, binary)
+
+    test_short_messages(300, 0)
\ No newline at end of file
@@ -1,15 +1,12 @@
 # Substitution Cipher
 
 from ps4a import get_permutations
+from ps4_cipher import (VOWELS_LOWER, apply_transpose, build_transpose_dict,
+                        compile_table)
+from ps4_words import load_word_set
 
 WORDLIST_FILENAME = 'words.txt'
 
-# you may find these constants helpful
-VOWELS_LOWER = 'aeiou'
-VOWELS_UPPER = 'AEIOU'
-CONSONANTS_LOWER = 'bcdfghjklmnpqrstvwxyz'
-CONSONANTS_UPPER = 'BCDFGHJKLMNPQRSTVWXYZ'
-
 def load_words(file_name):
     '''
     file_name (string): the name of the file containing the list of
@@ -37,7 +34,8 @@ def is_word(word_list, word):
     Determines if word is a valid word, ignoring capitalization and
     punctuation
 
-    word_list (list): list of words in the dictionary.
+    word_list (frozenset or list): words in the dictionary. Lookups in
+    a frozenset take constant time.
     word (string): a possible word.
     
     Returns: True if word is in word_list, False otherwise
@@ -64,11 +62,11 @@ class SubMessage(object):
 
         A SubMessage object has two attributes:
             self.message_text (string, determined by input text)
-            self.valid_words (list, determined using helper function
-            load_words)
+            self.valid_words (frozenset, shared by all messages and
+            determined using helper function load_word_set)
         '''
         self.message_text = text
-        self.valid_words = load_words(WORDLIST_FILENAME)
+        self.valid_words = load_word_set(WORDLIST_FILENAME)
     
     def get_message_text(self):
         '''
@@ -80,12 +78,13 @@ class SubMessage(object):
 
     def get_valid_words(self):
         '''
-        Used to safely access a copy of self.valid_words outside of the
-        class.
+        Used to safely access self.valid_words outside of the class. The
+        words are a frozenset, so they cannot be mutated and need no
+        copy.
         
-        Returns: a COPY of self.valid_words
+        Returns: self.valid_words
         '''
-        return self.valid_words.copy()
+        return self.valid_words
                 
     def build_transpose_dict(self, vowels_permutation):
         '''
@@ -104,31 +103,22 @@ class SubMessage(object):
         Returns: a dictionary mapping a letter (string) to 
                  another letter (string). 
         '''
-        dic = {}
-        #Map vowels
-        for i, letter in enumerate(vowels_permutation):
-            dic[VOWELS_LOWER[i]] = letter.lower()
-            dic[VOWELS_UPPER[i]] = letter.upper()
-        #Map consonants
-        for i in range(len(CONSONANTS_LOWER)):
-            dic[CONSONANTS_LOWER[i]] = CONSONANTS_LOWER[i]
-            dic[CONSONANTS_UPPER[i]] = CONSONANTS_UPPER[i]
-        return dic
+        return build_transpose_dict(vowels_permutation)
     
     def apply_transpose(self, transpose_dict):
         '''
         transpose_dict (dict): a transpose dictionary
+
+        The dictionary can map letters any way, so it is compiled on
+        every call. When the vowel permutation is known,
+        ps4_cipher.apply_transpose uses a table compiled once per
+        permutation instead.
         
         Returns: an encrypted version of the message text, based on the
         dictionary
         '''
-        encrypted_message = ""
-        for letter in self.get_message_text():
-            if transpose_dict.get(letter,-1) == -1:
-                encrypted_message += letter
-            else:
-                encrypted_message += transpose_dict[letter]    
-        return encrypted_message
+        return self.get_message_text().translate(
+            compile_table(transpose_dict))
         
         
 class EncryptedSubMessage(SubMessage):
@@ -141,8 +131,8 @@ class EncryptedSubMessage(SubMessage):
         An EncryptedSubMessage object inherits from SubMessage and has
         two attributes:
             self.message_text (string, determined by input text)
-            self.valid_words (list, determined using helper function
-            load_words)
+            self.valid_words (frozenset, shared by all messages and
+            determined using helper function load_word_set)
         '''
         SubMessage.__init__(self,text)
 
@@ -165,8 +155,9 @@ class EncryptedSubMessage(SubMessage):
         max_valid_words = -1
         best_decrypted_message = decrypted_message = self.get_message_text()
         for vowels_permutation in possibly_permutation:
-            dic = self.build_transpose_dict(vowels_permutation)
-            decrypted_message = self.apply_transpose(dic)
+            # The table of each permutation is compiled once per process
+            decrypted_message = apply_transpose(self.get_message_text(),
+                                                vowels_permutation)
             decrypted_words = str.split(decrypted_message," ")
             n_valid_words = 0
             for word in decrypted_words:
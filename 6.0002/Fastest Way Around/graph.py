@@ -1,14 +1,46 @@
 # 6.0002 Problem Set 5
 # Graph optimization
 
+import mmap
+import os
+import pickle
+import tempfile
 import unittest
+import weakref
+from array import array
 from collections import defaultdict
 
+SNAPSHOT_MAGIC = b"CSRMAP2\n"
+
 # A set of data structures to represent graphs
 class Node(object):
-    """Represents a node in the graph"""
-    def __init__(self, name):
-        self.name = str(name)
+    """Represents a node in the graph. Nodes are interned: Node(name)
+    always returns the same instance for the same name, so equality is
+    identity and the inherited object hash applies, both computed without
+    looking at the name. The intern table only holds weak references, so
+    a Node that nothing else uses is freed."""
+    __slots__ = ('name', '__weakref__')
+    # name -> the Node with that name, for as long as it is alive
+    _registry = weakref.WeakValueDictionary()
+
+    def __new__(cls, name):
+        name = str(name)
+        node = cls._registry.get(name)
+        if node is None:
+            node = object.__new__(cls)
+            node.name = name
+            cls._registry[name] = node
+        return node
+
+    @classmethod
+    def lookup(cls, name):
+        """Returns the Node called name if one exists, None otherwise.
+        Unlike Node(name) it never creates a Node."""
+        return cls._registry.get(str(name))
+
+    def __reduce__(self):
+        # Unpickling goes through Node(name), so it stays interned
+        return (Node, (self.name,))
 
     def get_name(self):
         return self.name
@@ -19,20 +51,11 @@ class Node(object):
     def __repr__(self):
         return self.name
 
-    def __eq__(self, other):
-        return self.name == other.name
-
-    def __ne__(self, other):
-        return not self.__eq__(other)
-
-    def __hash__(self):
-        # This function is necessary so that Nodes can be used as
-        # keys in a dictionary, even though Nodes are mutable
-        return self.name.__hash__()
-
 class Edge(object):
     """Represents an edge in the dictionary. Includes a source and
     a destination."""
+    __slots__ = ('src', 'dest')
+
     def __init__(self, src, dest):
         self.src = src
         self.dest = dest
@@ -51,6 +74,8 @@ class WeightedEdge(Edge):
     """Represents an weighted edge in the dictionary. Includes a source,
     a destination, the total distance and the outdoor distance.
     """
+    __slots__ = ('total_distance', 'outdoor_distance')
+
     def __init__(self, src, dest, total_distance, outdoor_distance):
         Edge.__init__(self, src, dest)
         self.total_distance = total_distance
@@ -69,9 +94,15 @@ class WeightedEdge(Edge):
 
 class Digraph(object):
     """Represents a directed graph of Node and Edge objects"""
-    def __init__(self):
+    def __init__(self, keep_reverse=False):
+        """If keep_reverse is True the Digraph also indexes every edge by
+        its destination, so that edges can be followed backwards."""
         self.nodes = set([])
         self.edges = defaultdict(list)  # dict of Node -> list of edges
+        # dict of Node -> list of edges arriving at it, or None
+        self.reverse_edges = defaultdict(list) if keep_reverse else None
+        self.version = 0  # increased by every change to the graph
+        self.observers = []
 
     def __str__(self):
         edge_strs = []
@@ -84,6 +115,33 @@ class Digraph(object):
     def get_edges_for_node(self, node):
         return self.edges[node]
 
+    def has_reverse_edges(self):
+        return self.reverse_edges is not None
+
+    def get_reverse_edges_for_node(self, node):
+        """Returns the edges whose destination is node. Raises a
+        ValueError if the Digraph does not keep reverse edges."""
+        if self.reverse_edges is None:
+            raise ValueError("Digraph does not keep reverse edges.")
+        return self.reverse_edges[node]
+
+    def get_version(self):
+        return self.version
+
+    def add_observer(self, observer):
+        """Registers a function called as observer(change, item) after
+        every change to the graph, where change is "add_node", "add_edge"
+        or "remove_edge" and item the Node or Edge concerned."""
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def _changed(self, change, item):
+        self.version += 1
+        for observer in self.observers:
+            observer(change, item)
+
     def has_node(self, node):
         return node in self.nodes
 
@@ -93,6 +151,7 @@ class Digraph(object):
         if self.has_node(node):
             raise ValueError("Node already in digraph.")
         self.nodes.add(node)
+        self._changed("add_node", node)
 
     def add_edge(self, edge):
         """Adds an Edge or WeightedEdge instance to the Digraph. Raises
@@ -102,6 +161,209 @@ class Digraph(object):
             not self.has_node(edge.get_destination())):
             raise ValueError("Node not in digraph.")
         self.edges[edge.get_source()].append(edge)
+        if self.reverse_edges is not None:
+            self.reverse_edges[edge.get_destination()].append(edge)
+        self._changed("add_edge", edge)
+
+    def remove_edge(self, edge):
+        """Removes an edge from the Digraph. The edge is matched on its
+        source, destination and distances, so an equal edge built
+        separately removes the stored one. Raises a ValueError if no such
+        edge is in the graph."""
+        edges = self.edges.get(edge.get_source(), [])
+        key = _edge_key(edge)
+        for stored in edges:
+            if _edge_key(stored) == key:
+                break
+        else:
+            raise ValueError("Edge not in digraph.")
+        edges.remove(stored)
+        if self.reverse_edges is not None:
+            self.reverse_edges[stored.get_destination()].remove(stored)
+        self._changed("remove_edge", stored)
+
+def _edge_key(edge):
+    # Plain Edges have no distances
+    return (edge.src, edge.dest, getattr(edge, 'total_distance', None),
+            getattr(edge, 'outdoor_distance', None))
+
+class CompactDigraph(object):
+    """Represents a frozen, array-backed weighted directed graph.
+
+    Nodes are numbered 0..n-1 and the edges are stored in compressed sparse
+    row (CSR) form: the edges leaving node i are the entries
+    offsets[i]..offsets[i+1]-1 of the parallel targets, total_distances and
+    outdoor_distances arrays. Each edge costs three machine integers
+    instead of several Python objects, and nodes are addressed by id so no
+    Node needs to be built or hashed to walk the graph.
+    """
+    def __init__(self, names, offsets, targets, total_distances,
+                 outdoor_distances, ids=None):
+        """ids is the dict of name -> node id, built from names unless a
+        graph over the same names shares its own."""
+        self.names = names  # list of node names, indexed by node id
+        if ids is None:
+            ids = {name: i for i, name in enumerate(names)}
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+        self.total_distances = total_distances
+        self.outdoor_distances = outdoor_distances
+        self.reverse_graph = None  # built by get_reverse_graph
+
+    @classmethod
+    def from_edge_list(cls, names, sources, targets, total_distances,
+                       outdoor_distances, ids=None):
+        """Builds a CompactDigraph from parallel sequences describing one
+        edge each, with source and target given as indexes into names.
+        Edges keep their relative order within each source node. ids is
+        passed on to the constructor."""
+        n_nodes = len(names)
+        offsets = array('i', bytes(4 * (n_nodes + 1)))
+        for src in sources:
+            offsets[src + 1] += 1
+        for i in range(n_nodes):
+            offsets[i + 1] += offsets[i]
+        n_edges = len(sources)
+        csr_targets = array('i', bytes(4 * n_edges))
+        csr_total = array('i', bytes(4 * n_edges))
+        csr_outdoor = array('i', bytes(4 * n_edges))
+        position = offsets[:-1]
+        for i, src in enumerate(sources):
+            j = position[src]
+            position[src] = j + 1
+            csr_targets[j] = targets[i]
+            csr_total[j] = total_distances[i]
+            csr_outdoor[j] = outdoor_distances[i]
+        return cls(list(names), offsets, csr_targets, csr_total,
+                   csr_outdoor, ids)
+
+    @classmethod
+    def read(cls, snapshot_filename):
+        """Opens a snapshot written by save. The edge arrays, and those of
+        the reversed graph, are memory mapped from the file rather than
+        copied, so only the node names are parsed and processes opening
+        the same snapshot share one copy of both. Raises a ValueError if
+        the file is not a snapshot."""
+        with open(snapshot_filename, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            buffer.close()
+            raise ValueError("Not a map snapshot file.")
+        view = memoryview(buffer)
+        position = len(SNAPSHOT_MAGIC)
+        n_nodes, n_edges, names_size = view[position:position + 24].cast(
+            'q')
+        position += 24
+        names = str(view[position:position + names_size], "utf-8")
+        names = names.split("\n") if n_nodes else []
+        position += names_size + (-names_size % 4)
+        arrays = []
+        for size in (n_nodes + 1, n_edges, n_edges, n_edges) * 2:
+            arrays.append(view[position:position + 4 * size].cast('i'))
+            position += 4 * size
+        graph = cls(names, *arrays[:4])
+        graph.reverse_graph = cls(names, *arrays[4:], ids=graph.ids)
+        return graph
+
+    def save(self, snapshot_filename):
+        """Writes the graph to a binary snapshot: a header with the sizes
+        and node names followed by the offsets, targets, total_distances
+        and outdoor_distances arrays as native 32-bit integers, first of
+        the graph and then of its reverse."""
+        reverse_graph = self.get_reverse_graph()
+        names = "\n".join(self.names).encode("utf-8")
+        with open(snapshot_filename, "wb") as file:
+            file.write(SNAPSHOT_MAGIC)
+            array('q', [len(self.names), len(self.targets),
+                        len(names)]).tofile(file)
+            file.write(names + bytes(-len(names) % 4))
+            for graph in (self, reverse_graph):
+                for column in (graph.offsets, graph.targets,
+                               graph.total_distances,
+                               graph.outdoor_distances):
+                    file.write(column)
+
+    @classmethod
+    def from_digraph(cls, digraph):
+        """Builds a CompactDigraph holding the same nodes and weighted
+        edges as a Digraph. Node ids follow the sorted node names."""
+        names = sorted(node.get_name() for node in digraph.nodes)
+        ids = {name: i for i, name in enumerate(names)}
+        sources = array('i')
+        targets = array('i')
+        total_distances = array('i')
+        outdoor_distances = array('i')
+        for name in names:
+            src = ids[name]
+            for edge in digraph.edges.get(Node(name), ()):
+                sources.append(src)
+                targets.append(ids[edge.get_destination().get_name()])
+                total_distances.append(edge.get_total_distance())
+                outdoor_distances.append(edge.get_outdoor_distance())
+        return cls.from_edge_list(names, sources, targets, total_distances,
+                                  outdoor_distances)
+
+    def reverse(self):
+        """Returns a CompactDigraph with the same nodes and every edge
+        pointing the other way."""
+        sources = array('i')
+        for node in range(len(self.names)):
+            sources.extend([node] * (self.offsets[node + 1] -
+                                     self.offsets[node]))
+        return CompactDigraph.from_edge_list(
+            self.names, self.targets, sources, self.total_distances,
+            self.outdoor_distances, self.ids)
+
+    def get_reverse_graph(self):
+        """Returns the reversed graph, building it on the first call, or
+        mapping it from the snapshot, and keeping it."""
+        if self.reverse_graph is None:
+            self.reverse_graph = self.reverse()
+        return self.reverse_graph
+
+    def __str__(self):
+        edge_strs = []
+        for src, name in enumerate(self.names):
+            for dest, total, outdoor in self.get_edges_for_node(src):
+                edge_strs.append("{0}->{1} ({2}, {3})".format(
+                    name, self.names[dest], total, outdoor))
+        edge_strs = sorted(edge_strs)
+        return '\n'.join(edge_strs)
+
+    def get_num_nodes(self):
+        return len(self.names)
+
+    def get_num_edges(self):
+        return len(self.targets)
+
+    def has_node(self, name):
+        return name in self.ids
+
+    def get_node_id(self, name):
+        """Returns the id of the node called name. Raises a ValueError if
+        it is not in the graph."""
+        try:
+            return self.ids[name]
+        except KeyError:
+            raise ValueError("Node not in digraph.")
+
+    def get_node_name(self, node_id):
+        return self.names[node_id]
+
+    def get_edges_for_node(self, node_id):
+        """Returns an iterator of (destination id, total distance, outdoor
+        distance) tuples for the edges leaving node_id."""
+        begin = self.offsets[node_id]
+        end = self.offsets[node_id + 1]
+        return zip(self.targets[begin:end], self.total_distances[begin:end],
+                   self.outdoor_distances[begin:end])
+
+    def get_reverse_edges_for_node(self, node_id):
+        """Returns an iterator of (source id, total distance, outdoor
+        distance) tuples for the edges arriving at node_id, from
+        get_reverse_graph."""
+        return self.get_reverse_graph().get_edges_for_node(node_id)
 
 # Begin tests
 class TestGraph(unittest.TestCase):
@@ -121,6 +383,21 @@ class TestGraph(unittest.TestCase):
         self.g.add_edge(self.e2)
         self.g.add_edge(self.e3)
 
+    def test_nodes_are_interned(self):
+        self.assertIs(Node('a'), self.na)
+        self.assertIs(Node(7), Node('7'))
+        self.assertEqual(Node('a'), self.na)
+        self.assertNotEqual(self.na, self.nb)
+        self.assertIs(pickle.loads(pickle.dumps(self.na)), self.na)
+        with self.assertRaises(AttributeError):
+            self.na.colour = 'red'
+
+    def test_unused_nodes_are_freed(self):
+        self.assertIs(Node.lookup('a'), self.na)
+        Node('unused')
+        self.assertIsNone(Node.lookup('unused'))
+        self.assertIsNone(Node.lookup('never built'))
+
     def test_weighted_edge_str(self):
         self.assertEqual(str(self.e1), "a->b (15, 10)")
         self.assertEqual(str(self.e2), "a->c (14, 6)")
@@ -154,5 +431,102 @@ class TestGraph(unittest.TestCase):
         expected = "a->b (15, 10)\na->c (14, 6)\nb->c (3, 1)"
         self.assertEqual(str(self.g), expected)
 
+    def test_remove_edge(self):
+        self.g.remove_edge(self.e2)
+        self.assertEqual(str(self.g), "a->b (15, 10)\nb->c (3, 1)")
+        with self.assertRaises(ValueError):
+            self.g.remove_edge(self.e2)
+        with self.assertRaises(ValueError):
+            self.g.remove_edge(WeightedEdge(self.nb, self.nc, 3, 2))
+        # An equal edge built separately removes the stored one
+        self.g.remove_edge(WeightedEdge(self.nb, self.nc, 3, 1))
+        self.assertEqual(str(self.g), "a->b (15, 10)")
+
+    def test_version_and_observers(self):
+        changes = []
+        self.g.add_observer(lambda change, item: changes.append(
+            (change, str(item))))
+        version = self.g.get_version()
+        nd = Node('d')
+        self.g.add_node(nd)
+        edge = WeightedEdge(self.nc, nd, 1, 1)
+        self.g.add_edge(edge)
+        self.g.remove_edge(edge)
+        self.assertEqual(self.g.get_version(), version + 3)
+        self.assertEqual(changes, [("add_node", "d"),
+                                   ("add_edge", "c->d (1, 1)"),
+                                   ("remove_edge", "c->d (1, 1)")])
+
+    def test_reverse_edges(self):
+        self.assertFalse(self.g.has_reverse_edges())
+        with self.assertRaises(ValueError):
+            self.g.get_reverse_edges_for_node(self.nc)
+        g = Digraph(keep_reverse=True)
+        for node in (self.na, self.nb, self.nc):
+            g.add_node(node)
+        for edge in (self.e1, self.e2, self.e3):
+            g.add_edge(edge)
+        self.assertTrue(g.has_reverse_edges())
+        self.assertEqual(g.get_reverse_edges_for_node(self.nc),
+                         [self.e2, self.e3])
+        self.assertEqual(g.get_reverse_edges_for_node(self.na), [])
+
+class TestCompactDigraph(unittest.TestCase):
+
+    def setUp(self):
+        TestGraph.setUp(self)
+        self.compact = CompactDigraph.from_digraph(self.g)
+
+    def test_compact_str(self):
+        self.assertEqual(str(self.compact), str(self.g))
+
+    def test_compact_edges_for_node(self):
+        a = self.compact.get_node_id('a')
+        edges = [(self.compact.get_node_name(dest), total, outdoor)
+                 for dest, total, outdoor in
+                 self.compact.get_edges_for_node(a)]
+        self.assertEqual(edges, [('b', 15, 10), ('c', 14, 6)])
+        c = self.compact.get_node_id('c')
+        self.assertEqual(list(self.compact.get_edges_for_node(c)), [])
+
+    def test_compact_sizes(self):
+        self.assertEqual(self.compact.get_num_nodes(), 3)
+        self.assertEqual(self.compact.get_num_edges(), 3)
+
+    def test_snapshot_round_trip(self):
+        handle, filename = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            self.compact.save(filename)
+            snapshot = CompactDigraph.read(filename)
+            self.assertEqual(str(snapshot), str(self.g))
+            self.assertEqual(snapshot.names, self.compact.names)
+            self.assertEqual(list(snapshot.offsets),
+                             list(self.compact.offsets))
+            # The reverse graph comes from the file, not from reverse()
+            self.assertIsInstance(snapshot.reverse_graph.targets,
+                                  memoryview)
+            self.assertEqual(str(snapshot.reverse_graph),
+                             str(self.compact.reverse()))
+            del snapshot
+        finally:
+            os.remove(filename)
+
+    def test_compact_reverse(self):
+        reverse = self.compact.reverse()
+        c = reverse.get_node_id('c')
+        edges = [(reverse.get_node_name(dest), total, outdoor)
+                 for dest, total, outdoor in reverse.get_edges_for_node(c)]
+        self.assertEqual(sorted(edges), [('a', 14, 6), ('b', 3, 1)])
+        self.assertEqual(reverse.get_num_edges(), 3)
+        self.assertEqual(
+            sorted(self.compact.get_reverse_edges_for_node(c)),
+            sorted(reverse.get_edges_for_node(c)))
+
+    def test_compact_unknown_node_raises(self):
+        self.assertFalse(self.compact.has_node('q'))
+        with self.assertRaises(ValueError):
+            self.compact.get_node_id('q')
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -2,17 +2,70 @@
 # Graph optimization
 # Finding shortest paths through MIT buildings
 
+import bisect
+import heapq
+import sys
 import unittest
-from graph import Digraph, Node, WeightedEdge
+from array import array
+from collections import defaultdict
+from graph import CompactDigraph, Digraph, Node, WeightedEdge
 
 FILE_NAME = "mit_map.txt"
+# Outdoor distance recorded for nodes the search has not settled yet
+NO_LABEL = sys.maxsize
+# Characters of a map file parsed at a time
+MAP_CHUNK_SIZE = 1 << 24
 
-def load_map(map_filename):
+def _parse_map_chunk(text, ids, columns):
+    """
+    Parses whole lines of a map file and appends their edges to columns,
+    a tuple of (sources, targets, total distances, outdoor distances)
+    arrays. ids is a defaultdict that gives new building names the next
+    free id, so names are numbered without a Python-level loop.
+    """
+    tokens = text.split()
+    if len(tokens) % 4:
+        raise ValueError("Malformed map file.")
+    sources, targets, total_distances, outdoor_distances = columns
+    sources.extend(map(ids.__getitem__, tokens[0::4]))
+    targets.extend(map(ids.__getitem__, tokens[1::4]))
+    total_distances.extend(map(int, tokens[2::4]))
+    outdoor_distances.extend(map(int, tokens[3::4]))
+
+def read_map_columns(map_filename):
+    """
+    Parses the map file in large chunks into parallel edge columns.
+
+    Parameters:
+        map_filename : name of the map file, in the format read by load_map
+
+    Returns:
+        a tuple (names, sources, targets, total_distances,
+        outdoor_distances). names lists the buildings by id and the other
+        four are array('i') columns with one entry per edge, in file
+        order, sources and targets holding building ids.
+    """
+    ids = defaultdict()
+    ids.default_factory = ids.__len__
+    columns = (array('i'), array('i'), array('i'), array('i'))
+    rest = ""
+    with open(map_filename, "r") as file:
+        for chunk in iter(lambda: file.read(MAP_CHUNK_SIZE), ""):
+            chunk = rest + chunk
+            cut = chunk.rfind("\n") + 1
+            rest = chunk[cut:]
+            _parse_map_chunk(chunk[:cut], ids, columns)
+    _parse_map_chunk(rest, ids, columns)
+    return (list(ids),) + columns
+
+def load_map(map_filename, keep_reverse=False):
     """
     Parses the map file and constructs a directed graph
 
     Parameters:
         map_filename : name of the map file
+        keep_reverse : if True the Digraph also keeps reverse edges,
+        which enables bidirectional search, OPTIONAL
 
     Assumes:
         Each entry in the map file consists of the following four positive
@@ -26,20 +79,32 @@ def load_map(map_filename):
         a Digraph representing the map
     """
     print("Loading map from file...")
-    mit_map = Digraph()
-    with open(map_filename, "r") as file:
-        for line in file:
-            content = line.split()
-            src = Node(content[0])
-            dest = Node(content[1])
-            edge = WeightedEdge(src, dest, int(content[2]), int(content[3]))
-            if not mit_map.has_node(src):
-                mit_map.add_node(src)
-            if not mit_map.has_node(dest):
-                mit_map.add_node(dest)
-            mit_map.add_edge(edge)
+    names, sources, targets, total_distances, outdoor_distances = \
+        read_map_columns(map_filename)
+    mit_map = Digraph(keep_reverse)
+    nodes = [Node(name) for name in names]
+    for node in nodes:
+        mit_map.add_node(node)
+    for src, dest, total, outdoor in zip(sources, targets, total_distances,
+                                         outdoor_distances):
+        mit_map.add_edge(WeightedEdge(nodes[src], nodes[dest], total,
+                                      outdoor))
     return mit_map
 
+def load_compact_map(map_filename):
+    """
+    Parses the map file straight into a CompactDigraph, without building
+    Node or WeightedEdge objects.
+
+    Parameters:
+        map_filename : name of the map file, in the format read by load_map
+
+    Returns:
+        a CompactDigraph representing the map, with node ids as assigned
+        by read_map_columns
+    """
+    return CompactDigraph.from_edge_list(*read_map_columns(map_filename))
+
 def get_best_path(digraph, start, end, path, max_dist_outdoors, best_dist,
                   best_path):
     """
@@ -103,15 +168,380 @@ def get_best_path(digraph, start, end, path, max_dist_outdoors, best_dist,
                         best_dist = newPath[1]
         return (best_path, best_dist)
 
-def directed_dfs(digraph, start, end, max_total_dist, max_dist_outdoors):
+def _graph_view(digraph):
+    """
+    Adapts a Digraph or a CompactDigraph to the search routines below.
+
+    Returns a tuple (neighbors, reverse, new_table, key_of, name_of, keys)
+    where neighbors(key) lists the (destination key, total distance,
+    outdoor distance) of the edges leaving a node, reverse(key) lists the
+    (source key, total distance, outdoor distance) of the edges arriving
+    at it, or is None for a Digraph that keeps no reverse edges,
+    new_table() creates a per-node table filled with NO_LABEL, key_of(name)
+    and name_of(key) convert between building numbers and keys, and keys
+    lists every key. Keys are Node objects for a Digraph and integer ids
+    for a CompactDigraph. key_of raises a ValueError if the building is
+    not on the graph.
+    """
+    if isinstance(digraph, CompactDigraph):
+        n_nodes = digraph.get_num_nodes()
+        return (digraph.get_edges_for_node,
+                digraph.get_reverse_edges_for_node,
+                lambda: [NO_LABEL] * n_nodes, digraph.get_node_id,
+                digraph.get_node_name, range(n_nodes))
+    edges = digraph.edges
+
+    def neighbors(node):
+        return [(edge.dest, edge.total_distance, edge.outdoor_distance)
+                for edge in edges.get(node, ())]
+
+    reverse = None
+    if digraph.has_reverse_edges():
+        reverse_edges = digraph.reverse_edges
+
+        def reverse(node):
+            return [(edge.src, edge.total_distance, edge.outdoor_distance)
+                    for edge in reverse_edges.get(node, ())]
+
+    def key_of(name):
+        # Looking up an unknown building must not create a Node for it
+        node = Node.lookup(name)
+        if node is None or not digraph.has_node(node):
+            raise ValueError("Node not in digraph.")
+        return node
+    return (neighbors, reverse, lambda: defaultdict(lambda: NO_LABEL),
+            key_of, str, sorted(digraph.nodes, key=str))
+
+def _reverse_neighbors(digraph):
+    """
+    Returns a neighbors function, in the form given by _graph_view, that
+    follows the edges of digraph backwards, indexing them first if the
+    graph does not keep reverse edges.
+    """
+    reverse = _graph_view(digraph)[1]
+    if reverse is not None:
+        return reverse
+    reverse_edges = defaultdict(list)
+    for edges in digraph.edges.values():
+        for edge in edges:
+            reverse_edges[edge.dest].append((edge.src, edge.total_distance,
+                                             edge.outdoor_distance))
+    return lambda node: reverse_edges.get(node, ())
+
+def _search_view(digraph, start, end):
+    """
+    Returns a tuple (neighbors, reverse, new_table, start_key, end_key,
+    name_of) as described in _graph_view for a search from start to end.
+    Raises a ValueError if start or end is not on the graph.
     """
-    Finds the shortest path from start to end using a directed depth-first
-    search. The total distance traveled on the path must not
-    exceed max_total_dist, and the distance spent outdoors on this path must
-    not exceed max_dist_outdoors.
+    neighbors, reverse, new_table, key_of, name_of, _ = _graph_view(digraph)
+    try:
+        start_key = key_of(start)
+    except ValueError:
+        raise ValueError("Start not on digraph.")
+    try:
+        end_key = key_of(end)
+    except ValueError:
+        raise ValueError("End not on digraph.")
+    return (neighbors, reverse, new_table, start_key, end_key, name_of)
+
+def _distances_from(neighbors, new_table, source, weight):
+    """
+    Dijkstra search from source over the whole graph on one of the edge
+    weights (1 for total distance, 2 for outdoor distance). Returns a
+    per-node table of distances, NO_LABEL for unreachable nodes.
+    """
+    distance = new_table()
+    distance[source] = 0
+    settled = new_table()
+    heap = [(0, 0, source)]
+    counter = 1
+    while heap:
+        dist, _, node = heapq.heappop(heap)
+        if settled[node] != NO_LABEL:
+            continue
+        settled[node] = dist
+        for edge in neighbors(node):
+            new_dist = dist + edge[weight]
+            if new_dist < distance[edge[0]]:
+                distance[edge[0]] = new_dist
+                heapq.heappush(heap, (new_dist, counter, edge[0]))
+                counter += 1
+    return settled
+
+class Landmarks(object):
+    """Represents the distances between every building of a graph and a
+    few landmark buildings, on both total and outdoor distance. By the
+    triangle inequality they give lower bounds on the distances between
+    any two buildings (the ALT heuristic), which A* uses to steer the
+    search towards the destination."""
+    def __init__(self, digraph, n_landmarks=4):
+        """Picks n_landmarks buildings of digraph, each as far as possible
+        (in total distance) from the ones already picked, and runs four
+        Dijkstra searches from each of them."""
+        self.digraph = digraph
+        neighbors, _, new_table, key_of, name_of, keys = _graph_view(
+            digraph)
+        reverse = _reverse_neighbors(digraph)
+        self.key_of = key_of
+        self.new_table = new_table
+        self.landmarks = []
+        # Each entry: (from total, to total, from outdoor, to outdoor)
+        self.tables = []
+        nearest = new_table()
+        candidate = keys[0] if keys else None
+        for _ in range(min(n_landmarks, len(keys))):
+            tables = (_distances_from(neighbors, new_table, candidate, 1),
+                      _distances_from(reverse, new_table, candidate, 1),
+                      _distances_from(neighbors, new_table, candidate, 2),
+                      _distances_from(reverse, new_table, candidate, 2))
+            self.landmarks.append(name_of(candidate))
+            self.tables.append(tables)
+            farthest = -1
+            for key in keys:
+                nearest[key] = min(nearest[key], tables[0][key])
+                if farthest < nearest[key] < NO_LABEL:
+                    farthest = nearest[key]
+                    candidate = key
+            if farthest <= 0:
+                break
+
+    def get_landmarks(self):
+        return self.landmarks[:]
+
+    def get_lower_bounds(self, end_key):
+        """
+        Returns a function mapping a node key to a tuple (total, outdoor)
+        of lower bounds on the distances from that node to end_key. Both
+        are NO_LABEL when the landmarks show end_key cannot be reached.
+        Results are cached per node.
+        """
+        targets = [(tables, tables[0][end_key], tables[1][end_key],
+                    tables[2][end_key], tables[3][end_key])
+                   for tables in self.tables]
+        cache = self.new_table()
+
+        def bound(from_table, to_table, from_end, to_end, key):
+            # d(L, end) - d(L, v) and d(v, L) - d(end, L)
+            best = 0
+            from_key = from_table[key]
+            if from_key != NO_LABEL:
+                if from_end == NO_LABEL:
+                    return NO_LABEL
+                best = from_end - from_key
+            if to_end != NO_LABEL:
+                to_key = to_table[key]
+                if to_key == NO_LABEL:
+                    return NO_LABEL
+                best = max(best, to_key - to_end)
+            return best
+
+        def lower_bounds(key):
+            bounds = cache[key]
+            if bounds != NO_LABEL:
+                return bounds
+            total = outdoor = 0
+            for tables, total_from, total_to, outdoor_from, outdoor_to in \
+                    targets:
+                total = max(total, bound(tables[0], tables[1], total_from,
+                                         total_to, key))
+                outdoor = max(outdoor, bound(tables[2], tables[3],
+                                             outdoor_from, outdoor_to, key))
+            bounds = cache[key] = (total, outdoor)
+            return bounds
+        return lower_bounds
+
+def _trace_path(label, name_of):
+    """
+    Follows the parent links of a search label back to the start and
+    returns the list of building numbers (in strings) on the path.
+    """
+    path = []
+    while label is not None:
+        path.append(name_of(label[3]))
+        label = label[4]
+    path.reverse()
+    return path
+
+def _label_search(neighbors, new_table, start_node, end_node,
+                  max_total_dist, max_dist_outdoors, pareto,
+                  lower_bounds=None, stats=None):
+    """
+    Dijkstra-style search over (total distance, outdoor distance) labels.
+
+    Labels are settled in increasing order of total distance, ties broken
+    by outdoor distance. With pareto set to False every node is settled
+    once, which is a plain Dijkstra search on total distance that ignores
+    max_dist_outdoors. With pareto set to True a label arriving at a node
+    is only discarded when a label already settled there walked no more
+    outdoors, since that label is at least as good on both distances.
+
+    When lower_bounds is given (see Landmarks.get_lower_bounds) the search
+    runs as A*: labels are settled in increasing order of total distance
+    plus the lower bound on the remaining distance, and labels whose
+    bounds already exceed max_total_dist (or max_dist_outdoors, with
+    pareto) are dropped. The bounds are consistent, so the first label of
+    end_node settled is still the best one.
+
+    new_table() must return an empty per-node table that reads as
+    NO_LABEL for nodes never written. If stats is a dictionary, its
+    'settled' entry is increased by the number of labels settled, and
+    the nodes settled are added to its 'touched' set if it has one.
+
+    Returns the settled label of end_node, or None if it is unreachable
+    within the limits. A label is a tuple (priority, outdoor, tie
+    breaker, node, parent label, total).
+    """
+    # Smallest outdoor distance among the labels settled at each node. A
+    # plain Dijkstra search stores -1 so that the node is never reopened.
+    best_outdoor = new_table()
+    heap = [(0, 0, 0, start_node, None, 0)]
+    counter = 1
+    settled = 0
+    touched = None if stats is None else stats.get('touched')
+    result = None
+    while heap:
+        label = heapq.heappop(heap)
+        _, outdoor, _, node, _, total = label
+        if outdoor >= best_outdoor[node]:
+            continue
+        best_outdoor[node] = outdoor if pareto else -1
+        settled += 1
+        if touched is not None:
+            touched.add(node)
+        if node == end_node:
+            result = label
+            break
+        for dest, edge_total, edge_outdoor in neighbors(node):
+            new_total = total + edge_total
+            if new_total > max_total_dist:
+                continue
+            new_outdoor = outdoor + edge_outdoor
+            if new_outdoor >= best_outdoor[dest]:
+                continue
+            priority = new_total
+            if lower_bounds is not None:
+                total_bound, outdoor_bound = lower_bounds(dest)
+                priority += total_bound
+                if priority > max_total_dist:
+                    continue
+                if pareto and new_outdoor + outdoor_bound > max_dist_outdoors:
+                    continue
+            elif pareto and new_outdoor > max_dist_outdoors:
+                continue
+            heapq.heappush(heap, (priority, new_outdoor, counter, dest,
+                                  label, new_total))
+            counter += 1
+    if stats is not None:
+        stats['settled'] = stats.get('settled', 0) + settled
+    return result
+
+def _bidirectional_search(neighbors, reverse, new_table, start_node,
+                          end_node, max_total_dist, stats=None):
+    """
+    Bidirectional Dijkstra search for the path from start_node to
+    end_node with the smallest (total distance, outdoor distance) pair,
+    compared in that order, ignoring any outdoor limit.
+
+    One search grows forward from start_node and one backward from
+    end_node along reverse, always expanding the side whose next distance
+    is smaller. Every edge reaching a node already labelled by the other
+    side gives a candidate path; the search stops once the two smallest
+    unsettled distances add up to no less than the best candidate, which
+    is then optimal.
+
+    If stats is a dictionary, its 'settled' entry is increased by the
+    number of nodes settled on both sides, and those nodes are added to
+    its 'touched' set if it has one.
+
+    Returns a tuple (path, total, outdoor) where path lists the node keys
+    from start_node to end_node, or None if end_node is unreachable
+    within max_total_dist.
+    """
+    if start_node == end_node:
+        return ([start_node], 0, 0)
+    # Index 0 is the forward side, index 1 the backward side
+    expand = (neighbors, reverse)
+    distance = (new_table(), new_table())
+    parent = (new_table(), new_table())
+    settled = (new_table(), new_table())
+    heaps = ([(0, 0, 0, start_node)], [(0, 0, 0, end_node)])
+    distance[0][start_node] = (0, 0)
+    distance[1][end_node] = (0, 0)
+    counter = 1
+    n_settled = 0
+    touched = None if stats is None else stats.get('touched')
+    best = None
+    meeting_node = None
+    while heaps[0] and heaps[1]:
+        top = (heaps[0][0][0] + heaps[1][0][0],
+               heaps[0][0][1] + heaps[1][0][1])
+        if top[0] > max_total_dist or (best is not None and top >= best):
+            break
+        side = 0 if heaps[0][0][:2] <= heaps[1][0][:2] else 1
+        total, outdoor, _, node = heapq.heappop(heaps[side])
+        if settled[side][node] != NO_LABEL:
+            continue
+        settled[side][node] = 1
+        n_settled += 1
+        if touched is not None:
+            touched.add(node)
+        other_distance = distance[1 - side]
+        for dest, edge_total, edge_outdoor in expand[side](node):
+            key = (total + edge_total, outdoor + edge_outdoor)
+            if key[0] > max_total_dist:
+                continue
+            known = distance[side][dest]
+            if known != NO_LABEL and key >= known:
+                continue
+            distance[side][dest] = key
+            parent[side][dest] = node
+            heapq.heappush(heaps[side], key + (counter, dest))
+            counter += 1
+            other = other_distance[dest]
+            if other != NO_LABEL:
+                candidate = (key[0] + other[0], key[1] + other[1])
+                if best is None or candidate < best:
+                    best = candidate
+                    meeting_node = dest
+    if stats is not None:
+        stats['settled'] = stats.get('settled', 0) + n_settled
+    if best is None or best[0] > max_total_dist:
+        return None
+    path = [meeting_node]
+    node = meeting_node
+    while node != start_node:
+        node = parent[0][node]
+        path.append(node)
+    path.reverse()
+    node = meeting_node
+    while node != end_node:
+        node = parent[1][node]
+        path.append(node)
+    return (path, best[0], best[1])
+
+def constrained_shortest_path(digraph, start, end, max_total_dist,
+                              max_dist_outdoors, landmarks=None, stats=None):
+    """
+    Finds the shortest path between buildings subject to constraints using
+    a label-setting search instead of enumerating every simple path.
+
+    A search for the shortest path ignoring max_dist_outdoors runs first;
+    when the path it finds stays within max_dist_outdoors no shorter path
+    can exist and it is returned directly. That search is A* when
+    landmarks are given, a bidirectional Dijkstra search when the graph
+    can be walked backwards (a CompactDigraph, or a Digraph keeping
+    reverse edges), and a plain Dijkstra search in all other cases.
+
+    If that path goes over max_dist_outdoors, the outdoor constraint is
+    binding and a label-setting search over (total distance, outdoor
+    distance) pairs with dominance pruning finds the shortest path that
+    respects it. Each label kept at a node has strictly less outdoor
+    distance than the ones settled there before it, which keeps the
+    search polynomial.
 
     Parameters:
-        digraph: Digraph instance
+        digraph: Digraph or CompactDigraph instance
             The graph on which to carry out the search
         start: string
             Building number at which to start
@@ -121,6 +551,73 @@ def directed_dfs(digraph, start, end, max_total_dist, max_dist_outdoors):
             Maximum total distance on a path
         max_dist_outdoors: int
             Maximum distance spent outdoors on a path
+        landmarks: Landmarks instance built for digraph, OPTIONAL
+            Turns both searches into A* searches guided by the landmarks
+        stats: dictionary, OPTIONAL
+            Its 'settled' entry is increased by the number of search
+            labels settled, for instrumentation. If it has a 'touched'
+            set, the keys of every node settled are added to it.
+
+    Returns:
+        A tuple with the shortest-path from start to end, represented by
+        a list of building numbers (in strings), and the total distance of
+        that path.
+
+        If there exists no path that satisfies max_total_dist and
+        max_dist_outdoors constraints, then return None.
+    """
+    neighbors, reverse, new_table, start_key, end_key, name_of = \
+        _search_view(digraph, start, end)
+    lower_bounds = None
+    if landmarks is not None:
+        lower_bounds = landmarks.get_lower_bounds(end_key)
+    elif reverse is not None:
+        found = _bidirectional_search(neighbors, reverse, new_table,
+                                      start_key, end_key, max_total_dist,
+                                      stats)
+        if found is None:
+            return None
+        path, total, outdoor = found
+        if outdoor <= max_dist_outdoors:
+            return ([name_of(key) for key in path], total)
+    if lower_bounds is not None or reverse is None:
+        label = _label_search(neighbors, new_table, start_key, end_key,
+                              max_total_dist, max_dist_outdoors, False,
+                              lower_bounds, stats)
+        if label is None:
+            return None
+        if label[1] <= max_dist_outdoors:
+            return (_trace_path(label, name_of), label[5])
+    label = _label_search(neighbors, new_table, start_key, end_key,
+                          max_total_dist, max_dist_outdoors, True,
+                          lower_bounds, stats)
+    if label is None:
+        return None
+    return (_trace_path(label, name_of), label[5])
+
+def directed_dfs(digraph, start, end, max_total_dist, max_dist_outdoors,
+                 landmarks=None, stats=None):
+    """
+    Finds the shortest path from start to end using the label-setting
+    search of constrained_shortest_path. The total distance traveled on
+    the path must not exceed max_total_dist, and the distance spent
+    outdoors on this path must not exceed max_dist_outdoors.
+
+    Parameters:
+        digraph: Digraph or CompactDigraph instance
+            The graph on which to carry out the search
+        start: string
+            Building number at which to start
+        end: string
+            Building number at which to end
+        max_total_dist: int
+            Maximum total distance on a path
+        max_dist_outdoors: int
+            Maximum distance spent outdoors on a path
+        landmarks: Landmarks instance built for digraph, OPTIONAL
+            Runs the search as A* with the landmark lower bounds
+        stats: dictionary, OPTIONAL
+            Collects the number of settled search labels under 'settled'
 
     Returns:
         The shortest-path from start to end, represented by
@@ -131,15 +628,111 @@ def directed_dfs(digraph, start, end, max_total_dist, max_dist_outdoors):
         If there exists no path that satisfies max_total_dist and
         max_dist_outdoors constraints, then raises a ValueError.
     """
-    path_dist = get_best_path(digraph, start, end, [[],0,0], max_dist_outdoors,
-                              max_total_dist, None)
-    if path_dist[0] ==  None:
-        raise ValueError("Not possible to satisfy max_dist_outdoors")
-    elif path_dist[1] > max_total_dist:
-        raise ValueError("Not possible to satisfy max_total_dist")
-    else:    
-        return path_dist[0]
-        
+    path_dist = constrained_shortest_path(digraph, start, end,
+                                          max_total_dist, max_dist_outdoors,
+                                          landmarks, stats)
+    if path_dist is None:
+        raise ValueError("Not possible to satisfy max_total_dist and "
+                         "max_dist_outdoors")
+    return path_dist[0]
+
+class Frontier(list):
+    """A list of (path, total distance, outdoor distance) tuples as built
+    by pareto_frontier. It also keeps the negated outdoor distances, which
+    increase along the frontier, so that every query is a binary search
+    on a list built once."""
+    def __init__(self, paths=()):
+        list.__init__(self, paths)
+        self.negated_outdoor = [-outdoor for _, _, outdoor in self]
+
+def pareto_frontier(digraph, start, end, max_total_dist=NO_LABEL):
+    """
+    Finds every non-dominated path from start to end in a single
+    multi-objective label-setting search. A path is non-dominated when no
+    other path is at least as short in total and at least as short
+    outdoors while being strictly shorter in one of them.
+
+    The search is the Pareto label-setting search of
+    constrained_shortest_path without an outdoor limit that keeps going
+    after reaching end. Labels whose outdoor distance is no better than
+    the last path found to end are dropped, since that path already
+    dominates them.
+
+    Parameters:
+        digraph: Digraph or CompactDigraph instance
+            The graph on which to carry out the search
+        start: string
+            Building number at which to start
+        end: string
+            Building number at which to end
+        max_total_dist: int
+            Maximum total distance on a path, OPTIONAL
+
+    Returns:
+        A Frontier, the list of (path, total distance, outdoor distance)
+        tuples sorted by increasing total distance, hence by strictly
+        decreasing outdoor distance. Paths are lists of building numbers
+        (in strings). The list is empty when end cannot be reached.
+    """
+    neighbors, _, new_table, start_key, end_key, name_of = _search_view(
+        digraph, start, end)
+    best_outdoor = new_table()
+    frontier = []
+    heap = [(0, 0, 0, start_key, None)]
+    counter = 1
+    while heap:
+        label = heapq.heappop(heap)
+        total, outdoor, _, node, _ = label
+        if outdoor >= best_outdoor[node] or outdoor >= best_outdoor[end_key]:
+            continue
+        best_outdoor[node] = outdoor
+        if node == end_key:
+            frontier.append((_trace_path(label, name_of), total, outdoor))
+            if outdoor == 0:
+                break
+            continue
+        for dest, edge_total, edge_outdoor in neighbors(node):
+            new_total = total + edge_total
+            if new_total > max_total_dist:
+                continue
+            new_outdoor = outdoor + edge_outdoor
+            if (new_outdoor >= best_outdoor[dest]
+                    or new_outdoor >= best_outdoor[end_key]):
+                continue
+            heapq.heappush(heap, (new_total, new_outdoor, counter, dest,
+                                  label))
+            counter += 1
+    return Frontier(frontier)
+
+def frontier_best_path(frontier, max_total_dist, max_dist_outdoors):
+    """
+    Answers a directed_dfs query from a frontier computed by
+    pareto_frontier, using a binary search on the outdoor distances.
+
+    Parameters:
+        frontier: Frontier returned by pareto_frontier. A plain list of
+        its tuples is also accepted, at the cost of a pass over it.
+        max_total_dist: int
+            Maximum total distance on a path
+        max_dist_outdoors: int
+            Maximum distance spent outdoors on a path
+
+    Returns:
+        The shortest path (list of building numbers in strings) whose
+        distances satisfy both limits.
+
+        If there exists no path that satisfies max_total_dist and
+        max_dist_outdoors constraints, then raises a ValueError.
+    """
+    if not isinstance(frontier, Frontier):
+        frontier = Frontier(frontier)
+    # The first entry within the outdoor limit is the shortest one
+    i = bisect.bisect_left(frontier.negated_outdoor, -max_dist_outdoors)
+    if i == len(frontier) or frontier[i][1] > max_total_dist:
+        raise ValueError("Not possible to satisfy max_total_dist and "
+                         "max_dist_outdoors")
+    return frontier[i][0]
+
 # Begin tests
 class Ps2Test(unittest.TestCase):
     LARGE_DIST = 99999
@@ -221,6 +814,101 @@ class Ps2Test(unittest.TestCase):
     def test_impossible_path2(self):
         self._test_impossible_path('10', '32', total_dist=100)
 
+    def test_matches_exhaustive_search(self):
+        for start, end, outdoor_dist in [('1', '32', 0), ('10', '50', 30),
+                                         ('2', '9', 50), ('32', '56', 99)]:
+            expected = get_best_path(self.graph, start, end, [[], 0, 0],
+                                     outdoor_dist, Ps2Test.LARGE_DIST, None)
+            actual = constrained_shortest_path(self.graph, start, end,
+                                               Ps2Test.LARGE_DIST,
+                                               outdoor_dist)
+            self.assertEqual(expected[1], actual[1])
+
+    def test_landmarks_match_plain_search(self):
+        landmarks = Landmarks(self.graph, 3)
+        self.assertEqual(len(landmarks.get_landmarks()), 3)
+        plain_stats = {}
+        astar_stats = {}
+        for start, end in [('1', '32'), ('10', '50'), ('2', '9'),
+                           ('32', '56'), ('8', '50'), ('16', '68')]:
+            for outdoor_dist in (0, 30, 100, Ps2Test.LARGE_DIST):
+                plain = constrained_shortest_path(
+                    self.graph, start, end, Ps2Test.LARGE_DIST,
+                    outdoor_dist, stats=plain_stats)
+                astar = constrained_shortest_path(
+                    self.graph, start, end, Ps2Test.LARGE_DIST,
+                    outdoor_dist, landmarks, astar_stats)
+                self.assertEqual(plain is None, astar is None)
+                if plain is not None:
+                    self.assertEqual(plain[1], astar[1])
+        self.assertLess(astar_stats['settled'], plain_stats['settled'])
+
+    def test_bidirectional_matches_dijkstra(self):
+        forward = load_map("mit_map.txt")
+        both_ways = load_map("mit_map.txt", keep_reverse=True)
+        names = sorted(str(node) for node in forward.nodes)
+        for start in names:
+            for end in names:
+                for total_dist in (150, Ps2Test.LARGE_DIST):
+                    self.assertEqual(
+                        constrained_shortest_path(forward, start, end,
+                                                  total_dist,
+                                                  Ps2Test.LARGE_DIST),
+                        constrained_shortest_path(both_ways, start, end,
+                                                  total_dist,
+                                                  Ps2Test.LARGE_DIST))
+
+    def test_pareto_frontier(self):
+        frontier = pareto_frontier(self.graph, '1', '32')
+        self.assertEqual(frontier[0][0], ['1', '4', '12', '32'])
+        self.assertEqual(frontier[-1][0],
+                         ['1', '3', '10', '4', '12', '24', '34', '36', '32'])
+        self.assertEqual(frontier[-1][2], 0)
+        self.assertEqual(frontier.negated_outdoor,
+                         [-outdoor for _, _, outdoor in frontier])
+        for (_, total1, outdoor1), (_, total2, outdoor2) in zip(
+                frontier, frontier[1:]):
+            self.assertLess(total1, total2)
+            self.assertGreater(outdoor1, outdoor2)
+
+    def test_frontier_matches_directed_dfs(self):
+        frontier = pareto_frontier(self.graph, '10', '50')
+        for outdoor_dist in range(30, 200, 10):
+            self.assertEqual(
+                frontier_best_path(frontier, Ps2Test.LARGE_DIST,
+                                   outdoor_dist),
+                directed_dfs(self.graph, '10', '50', Ps2Test.LARGE_DIST,
+                             outdoor_dist))
+        with self.assertRaises(ValueError):
+            frontier_best_path(frontier, Ps2Test.LARGE_DIST, 0)
+        with self.assertRaises(ValueError):
+            frontier_best_path(frontier, 100, Ps2Test.LARGE_DIST)
+
+    def test_frontier_unreachable(self):
+        self.assertEqual(pareto_frontier(self.graph, '8', '50', 0), [])
+
+
+class Ps2CompactTest(Ps2Test):
+
+    def setUp(self):
+        self.graph = load_compact_map("mit_map.txt")
+
+    def test_load_map_basic(self):
+        self.assertTrue(isinstance(self.graph, CompactDigraph))
+        self.assertEqual(self.graph.get_num_nodes(), 37)
+        self.assertEqual(self.graph.get_num_edges(), 129)
+        self.assertEqual(str(self.graph), str(load_map("mit_map.txt")))
+
+    def test_matches_exhaustive_search(self):
+        digraph = load_map("mit_map.txt")
+        for start, end, outdoor_dist in [('1', '32', 0), ('10', '50', 30),
+                                         ('2', '9', 50), ('32', '56', 99)]:
+            self.assertEqual(
+                constrained_shortest_path(digraph, start, end,
+                                          Ps2Test.LARGE_DIST, outdoor_dist),
+                constrained_shortest_path(self.graph, start, end,
+                                          Ps2Test.LARGE_DIST, outdoor_dist))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
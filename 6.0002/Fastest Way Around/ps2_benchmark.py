@@ -0,0 +1,360 @@
+# 6.0002 Problem Set 5
+# Graph optimization
+# Benchmarks for the route search on synthetic campus maps
+
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from graph import CompactDigraph, Digraph, Node, WeightedEdge
+from ps2 import (Landmarks, load_map, load_compact_map, get_best_path,
+                 constrained_shortest_path, directed_dfs, pareto_frontier,
+                 frontier_best_path)
+from route_batch import RouteBatchService
+
+SIZES = [1000, 10000, 100000]
+QUERIES = 20
+# The exhaustive search is only run on maps where it finishes in seconds
+DFS_MAX_NODES = 40
+# Outdoor limits swept per origin/destination pair by the kiosk benchmark
+SWEEP_LIMITS = list(range(0, 1000, 50))
+FRONTIER_SIZES = [1000, 10000]
+# About a million edges
+COMPACT_NODES = 250000
+LOAD_EDGES = 1000000
+ASTAR_SIZES = [1000, 10000, 100000]
+BIDIRECTIONAL_SIZES = [1000, 10000, 100000]
+# Queries on mit_map.txt answered by the batch benchmark
+BATCH_QUERIES = 2000
+# Edges of the synthetic map built by the Node memory benchmark
+NODE_EDGES = 1000000
+# The routes of Ps2Test searched without an outdoor limit
+TEST_ROUTES = [('32', '56'), ('2', '9'), ('1', '32'), ('10', '32')]
+N_LANDMARKS = 8
+
+def make_campus_graph(n_nodes, seed=0, keep_reverse=False):
+    """
+    Builds a synthetic campus map: buildings laid out on a square grid,
+    each connected both ways to its grid neighbours, plus a few long
+    shortcuts. Roughly a third of the connections are indoor (zero
+    outdoor distance), the rest are partly or fully outdoors.
+
+    Parameters:
+        n_nodes: int
+            Number of buildings on the map
+        seed: int
+            Seed for the random generator, so maps are reproducible
+        keep_reverse: bool
+            Whether the Digraph keeps reverse edges
+
+    Returns:
+        a Digraph representing the map
+    """
+    rng = random.Random(seed)
+    side = max(1, int(n_nodes ** 0.5))
+    campus = Digraph(keep_reverse)
+    nodes = [Node(i) for i in range(n_nodes)]
+    for node in nodes:
+        campus.add_node(node)
+
+    def connect(a, b):
+        total = rng.randint(20, 150)
+        if rng.random() < 0.35:
+            outdoor = 0
+        else:
+            outdoor = rng.randint(1, total)
+        campus.add_edge(WeightedEdge(nodes[a], nodes[b], total, outdoor))
+        campus.add_edge(WeightedEdge(nodes[b], nodes[a], total, outdoor))
+
+    for i in range(n_nodes):
+        if (i + 1) % side and i + 1 < n_nodes:
+            connect(i, i + 1)
+        if i + side < n_nodes:
+            connect(i, i + side)
+        if rng.random() < 0.02:
+            connect(i, rng.randrange(n_nodes))
+    return campus
+
+def make_queries(digraph, n_queries, seed=0):
+    """
+    Returns a list of (start, end, max_total_dist, max_dist_outdoors)
+    queries between random buildings of digraph.
+    """
+    rng = random.Random(seed)
+    names = sorted(str(node) for node in digraph.nodes)
+    queries = []
+    for _ in range(n_queries):
+        start, end = rng.sample(names, 2)
+        max_outdoor = rng.choice([0, 100, 500, 99999])
+        queries.append((start, end, 99999999, max_outdoor))
+    return queries
+
+def time_queries(search, digraph, queries):
+    """
+    Runs search(digraph, start, end, max_total, max_outdoor) for every
+    query and returns the elapsed time in seconds.
+    """
+    start_time = time.perf_counter()
+    for start, end, max_total, max_outdoor in queries:
+        search(digraph, start, end, max_total, max_outdoor)
+    return time.perf_counter() - start_time
+
+def exhaustive_search(digraph, start, end, max_total, max_outdoor):
+    return get_best_path(digraph, start, end, [[], 0, 0], max_outdoor,
+                         max_total, None)
+
+def report(label, digraph, queries):
+    new_time = time_queries(constrained_shortest_path, digraph, queries)
+    if len(digraph.nodes) <= DFS_MAX_NODES:
+        old_time = time_queries(exhaustive_search, digraph, queries)
+        print("{:>12} {:>8} {:>10.4f} {:>12.4f} {:>8.1f}x".format(
+            label, len(queries), old_time, new_time, old_time / new_time))
+    else:
+        print("{:>12} {:>8} {:>10} {:>12.4f} {:>9}".format(
+            label, len(queries), "-", new_time, "-"))
+
+def run_benchmark():
+    print("{:>12} {:>8} {:>10} {:>12} {:>9}".format(
+        "map", "queries", "dfs (s)", "label (s)", "speedup"))
+    mit_map = load_map("mit_map.txt")
+    report("mit_map", mit_map, make_queries(mit_map, QUERIES))
+    small = make_campus_graph(DFS_MAX_NODES)
+    report(str(DFS_MAX_NODES), small, make_queries(small, QUERIES))
+    for size in SIZES:
+        campus = make_campus_graph(size)
+        report(str(size), campus, make_queries(campus, QUERIES))
+
+def traced_build(build, *args):
+    """
+    Calls build(*args) and returns its result with the number of bytes
+    it left allocated.
+    """
+    tracemalloc.start()
+    result = build(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def run_compact_benchmark():
+    campus, campus_bytes = traced_build(make_campus_graph, COMPACT_NODES)
+    compact, compact_bytes = traced_build(CompactDigraph.from_digraph,
+                                          campus)
+    n_edges = compact.get_num_edges()
+    print("{} buildings, {} edges".format(compact.get_num_nodes(), n_edges))
+    print("{:>14} {:>14} {:>14}".format("", "bytes/edge", "query (s)"))
+    queries = [(start, end, 99999999, 99999999)
+               for start, end, _, _ in make_queries(campus, QUERIES)]
+    for label, digraph, size in [("Digraph", campus, campus_bytes),
+                                 ("CompactDigraph", compact, compact_bytes)]:
+        elapsed = time_queries(constrained_shortest_path, digraph, queries)
+        print("{:>14} {:>14.1f} {:>14.4f}".format(
+            label, size / n_edges, elapsed / len(queries)))
+
+def sweep_separately(digraph, start, end, max_total, max_outdoor):
+    """
+    Answers every limit of SWEEP_LIMITS for one pair with its own search.
+    The limits of the query itself are ignored.
+    """
+    for max_outdoor in SWEEP_LIMITS:
+        try:
+            directed_dfs(digraph, start, end, 99999999, max_outdoor)
+        except ValueError:
+            pass
+
+def sweep_frontier(digraph, start, end, max_total, max_outdoor):
+    """
+    Answers every limit of SWEEP_LIMITS for one pair from one frontier.
+    The limits of the query itself are ignored.
+    """
+    frontier = pareto_frontier(digraph, start, end)
+    for max_outdoor in SWEEP_LIMITS:
+        try:
+            frontier_best_path(frontier, 99999999, max_outdoor)
+        except ValueError:
+            pass
+
+def run_frontier_benchmark():
+    print("{} outdoor limits per pair".format(len(SWEEP_LIMITS)))
+    print("{:>12} {:>8} {:>14} {:>14} {:>9}".format(
+        "map", "pairs", "separate (s)", "frontier (s)", "speedup"))
+    maps = [("mit_map", load_map("mit_map.txt"))]
+    maps += [(str(size), make_campus_graph(size)) for size in FRONTIER_SIZES]
+    for label, digraph in maps:
+        queries = make_queries(digraph, QUERIES)
+        separate = time_queries(sweep_separately, digraph, queries)
+        frontier = time_queries(sweep_frontier, digraph, queries)
+        print("{:>12} {:>8} {:>14.4f} {:>14.4f} {:>8.1f}x".format(
+            label, len(queries), separate, frontier, separate / frontier))
+
+def write_map_file(map_filename, n_edges, seed=0):
+    """
+    Writes a random map file with n_edges lines over n_edges // 4
+    buildings, in the format read by load_map.
+    """
+    rng = random.Random(seed)
+    n_nodes = max(2, n_edges // 4)
+    with open(map_filename, "w") as file:
+        for _ in range(n_edges):
+            total = rng.randint(20, 150)
+            file.write("{} {} {} {}\n".format(
+                rng.randrange(n_nodes), rng.randrange(n_nodes), total,
+                rng.randint(0, total)))
+
+def time_call(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+def run_load_benchmark():
+    directory = tempfile.mkdtemp()
+    map_filename = os.path.join(directory, "map.txt")
+    snapshot_filename = os.path.join(directory, "map.csr")
+    write_map_file(map_filename, LOAD_EDGES)
+    scale = 1000000 / LOAD_EDGES
+    print("{} edges, seconds per million edges".format(LOAD_EDGES))
+    _, elapsed = time_call(load_map, map_filename)
+    print("{:>22} {:>10.3f}".format("load_map (Digraph)", elapsed * scale))
+    compact, elapsed = time_call(load_compact_map, map_filename)
+    print("{:>22} {:>10.3f}".format("load_compact_map", elapsed * scale))
+    _, elapsed = time_call(compact.save, snapshot_filename)
+    print("{:>22} {:>10.3f}".format("snapshot save", elapsed * scale))
+    snapshot, elapsed = time_call(CompactDigraph.read, snapshot_filename)
+    print("{:>22} {:>10.3f}".format("snapshot read", elapsed * scale))
+    del snapshot
+    os.remove(map_filename)
+    os.remove(snapshot_filename)
+    os.rmdir(directory)
+
+def run_astar_benchmark():
+    print("{} landmarks".format(N_LANDMARKS))
+    print("{:>12} {:>14} {:>14} {:>12} {:>12}".format(
+        "map", "settled", "A* settled", "time (s)", "A* time (s)"))
+    for size in ASTAR_SIZES:
+        campus = make_campus_graph(size)
+        queries = make_queries(campus, QUERIES)
+        campus = CompactDigraph.from_digraph(campus)
+        landmarks = Landmarks(campus, N_LANDMARKS)
+        plain_stats = {}
+        astar_stats = {}
+        plain = time_queries(
+            lambda *query: constrained_shortest_path(*query,
+                                                     stats=plain_stats),
+            campus, queries)
+        astar = time_queries(
+            lambda *query: constrained_shortest_path(*query, landmarks,
+                                                     astar_stats),
+            campus, queries)
+        print("{:>12} {:>14} {:>14} {:>12.4f} {:>12.4f}".format(
+            size, plain_stats['settled'], astar_stats['settled'], plain,
+            astar))
+
+def compare_bidirectional(label, forward, both_ways, pairs):
+    queries = [(start, end, 99999999, 99999999) for start, end in pairs]
+    forward_stats = {}
+    both_stats = {}
+    forward_time = time_queries(
+        lambda *query: constrained_shortest_path(*query,
+                                                 stats=forward_stats),
+        forward, queries)
+    both_time = time_queries(
+        lambda *query: constrained_shortest_path(*query, stats=both_stats),
+        both_ways, queries)
+    print("{:>12} {:>10} {:>10} {:>12.4f} {:>12.4f}".format(
+        label, forward_stats['settled'], both_stats['settled'],
+        forward_time, both_time))
+
+def run_bidirectional_benchmark():
+    print("{:>12} {:>10} {:>10} {:>12} {:>12}".format(
+        "map", "settled", "bi settled", "time (s)", "bi time (s)"))
+    compare_bidirectional("mit_map", load_map("mit_map.txt"),
+                          load_map("mit_map.txt", keep_reverse=True),
+                          TEST_ROUTES)
+    for size in BIDIRECTIONAL_SIZES:
+        forward = make_campus_graph(size)
+        pairs = [query[:2] for query in make_queries(forward, QUERIES)]
+        compare_bidirectional(str(size), forward,
+                              make_campus_graph(size, keep_reverse=True),
+                              pairs)
+
+def run_batch_benchmark(max_processes=None):
+    """
+    Prints batch throughput on mit_map.txt for 1, 2, 4, ... worker
+    processes up to max_processes (os.cpu_count() by default).
+    """
+    queries = make_queries(load_map("mit_map.txt"), BATCH_QUERIES)
+    max_processes = max_processes or os.cpu_count()
+    print("{} queries on {} cores".format(len(queries), os.cpu_count()))
+    print("{:>10} {:>14}".format("processes", "queries/s"))
+    with RouteBatchService("mit_map.txt") as service:
+        processes = 1
+        while processes <= max_processes:
+            start_time = time.perf_counter()
+            for _ in service.directed_dfs(queries, processes):
+                pass
+            elapsed = time.perf_counter() - start_time
+            print("{:>10} {:>14.0f}".format(processes,
+                                            len(queries) / elapsed))
+            processes *= 2
+
+class LegacyNode(object):
+    """The Node class before interning, kept to measure the difference:
+    one instance per endpoint, a __dict__ each, and equality and hash
+    computed in Python from the name."""
+    def __init__(self, name):
+        self.name = str(name)
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return self.name.__hash__()
+
+class LegacyWeightedEdge(object):
+    def __init__(self, src, dest, total_distance, outdoor_distance):
+        self.src = src
+        self.dest = dest
+        self.total_distance = total_distance
+        self.outdoor_distance = outdoor_distance
+
+def build_edges(node_class, edge_class, endpoints):
+    """
+    Builds one edge per pair of endpoint names, creating the endpoint
+    nodes through node_class the way load_map used to.
+    """
+    return [edge_class(node_class(src), node_class(dest), 1, 0)
+            for src, dest in endpoints]
+
+def run_node_benchmark():
+    rng = random.Random(0)
+    n_nodes = NODE_EDGES // 4
+    endpoints = [(str(rng.randrange(n_nodes)), str(rng.randrange(n_nodes)))
+                 for _ in range(NODE_EDGES)]
+    print("{} edges over {} buildings".format(NODE_EDGES, n_nodes))
+    print("{:>8} {:>12} {:>14}".format("", "bytes/edge", "lookups/s"))
+    for label, node_class, edge_class in [
+            ("legacy", LegacyNode, LegacyWeightedEdge),
+            ("interned", Node, WeightedEdge)]:
+        edges, size = traced_build(build_edges, node_class, edge_class,
+                                   endpoints)
+        table = {edge.src: edge for edge in edges}
+        start_time = time.perf_counter()
+        for edge in edges:
+            table.get(edge.dest)
+        elapsed = time.perf_counter() - start_time
+        print("{:>8} {:>12.1f} {:>14.0f}".format(
+            label, size / NODE_EDGES, NODE_EDGES / elapsed))
+        del edges, table
+
+if __name__ == "__main__":
+    run_benchmark()
+    run_compact_benchmark()
+    run_frontier_benchmark()
+    run_load_benchmark()
+    run_astar_benchmark()
+    run_bidirectional_benchmark()
+    run_batch_benchmark()
+    run_node_benchmark()
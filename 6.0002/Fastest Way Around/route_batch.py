@@ -0,0 +1,102 @@
+# 6.0002 Problem Set 5
+# Graph optimization
+# Batch route queries over a process pool sharing one read-only map
+
+import os
+import tempfile
+import unittest
+from multiprocessing import Pool
+from graph import CompactDigraph
+from ps2 import constrained_shortest_path, load_compact_map
+
+# Queries sent to a worker at a time
+CHUNK_SIZE = 64
+
+# The map opened by each worker process
+_worker_graph = None
+
+def _init_worker(snapshot_filename):
+    """
+    Opens the map snapshot in a worker process. The snapshot, reversed
+    graph included, is memory mapped, so every worker reads the same pages
+    of the file instead of holding its own copy of the graph.
+    """
+    global _worker_graph
+    _worker_graph = CompactDigraph.read(snapshot_filename)
+
+def _run_query(query):
+    # Only "no path" becomes None: unknown buildings raise to the caller
+    path_dist = constrained_shortest_path(_worker_graph, *query)
+    if path_dist is None:
+        return None
+    return path_dist[0]
+
+def batch_directed_dfs(snapshot_filename, queries, processes=None,
+                       chunksize=CHUNK_SIZE):
+    """
+    Answers many directed_dfs queries on a process pool.
+
+    Parameters:
+        snapshot_filename: string
+            Map snapshot written by CompactDigraph.save. Workers memory map
+            it, so the graph is never pickled.
+        queries: iterable of (start, end, max_total_dist,
+        max_dist_outdoors) tuples
+        processes: int, OPTIONAL
+            Number of worker processes, os.cpu_count() by default
+        chunksize: int, OPTIONAL
+            Number of queries handed to a worker at a time
+
+    Returns:
+        A generator of results in the order of queries: the path found by
+        directed_dfs, or None where no path satisfies the limits. Raises a
+        ValueError if a query names a building that is not on the map.
+    """
+    with Pool(processes, _init_worker, (snapshot_filename,)) as pool:
+        for path in pool.imap(_run_query, queries, chunksize):
+            yield path
+
+class RouteBatchService(object):
+    """Runs batch queries against a map file, writing its snapshot once
+    to a temporary file that the workers of every batch share."""
+    def __init__(self, map_filename):
+        handle, self.snapshot_filename = tempfile.mkstemp(suffix=".csr")
+        os.close(handle)
+        load_compact_map(map_filename).save(self.snapshot_filename)
+
+    def close(self):
+        if os.path.exists(self.snapshot_filename):
+            os.remove(self.snapshot_filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def directed_dfs(self, queries, processes=None, chunksize=CHUNK_SIZE):
+        """Same as batch_directed_dfs, on this service's map."""
+        return batch_directed_dfs(self.snapshot_filename, queries, processes,
+                                  chunksize)
+
+# Begin tests
+class TestRouteBatch(unittest.TestCase):
+
+    def test_matches_serial_queries(self):
+        compact = load_compact_map("mit_map.txt")
+        queries = [('32', '56', 99999, 99999), ('2', '9', 99999, 0),
+                   ('8', '50', 99999, 0), ('1', '32', 99999, 0),
+                   ('10', '32', 100, 99999), ('10', '50', 99999, 30)] * 20
+        expected = []
+        for query in queries:
+            path_dist = constrained_shortest_path(compact, *query)
+            expected.append(path_dist and path_dist[0])
+        with RouteBatchService("mit_map.txt") as service:
+            self.assertEqual(list(service.directed_dfs(queries, 2, 8)),
+                             expected)
+            with self.assertRaises(ValueError):
+                list(service.directed_dfs([('32', 'q', 99999, 99999)], 2))
+        self.assertFalse(os.path.exists(service.snapshot_filename))
+
+if __name__ == "__main__":
+    unittest.main()
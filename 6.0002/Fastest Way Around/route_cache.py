@@ -0,0 +1,168 @@
+# 6.0002 Problem Set 5
+# Graph optimization
+# LRU cache of route queries that survives edits to the map
+
+import unittest
+from collections import OrderedDict, defaultdict
+from graph import Node, WeightedEdge
+from ps2 import constrained_shortest_path, load_map
+
+class RouteCache(object):
+    """Caches directed_dfs results for a Digraph, least recently used
+    entries being evicted first.
+
+    The cache observes the Digraph and drops only the entries an edit can
+    affect. Removing an edge can only make the routes using it worse, so
+    it invalidates the entries whose path contains that edge. Adding an
+    edge u->v can only help a search that reached u, so it invalidates the
+    entries whose search settled u or v (v covers the backward half of a
+    bidirectional search). Every other entry is still optimal."""
+    def __init__(self, digraph, max_entries=1024):
+        self.digraph = digraph
+        self.max_entries = max_entries
+        # dict of query -> (path or None, touched nodes, path edges)
+        self.entries = OrderedDict()
+        self.by_node = defaultdict(set)  # dict of Node -> set of queries
+        self.by_edge = defaultdict(set)  # dict of (Node, Node) -> queries
+        self.hits = 0
+        self.misses = 0
+        digraph.add_observer(self._on_change)
+
+    def close(self):
+        """Stops observing the Digraph and empties the cache."""
+        self.digraph.remove_observer(self._on_change)
+        self.clear()
+
+    def clear(self):
+        self.entries.clear()
+        self.by_node.clear()
+        self.by_edge.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _drop(self, query):
+        _, touched, path_edges = self.entries.pop(query)
+        for index, keys in ((self.by_node, touched),
+                            (self.by_edge, path_edges)):
+            for key in keys:
+                queries = index[key]
+                queries.discard(query)
+                # Keys with no entries left would pile up in the index
+                if not queries:
+                    del index[key]
+
+    def _on_change(self, change, item):
+        if change == "add_edge":
+            queries = (self.by_node.get(item.get_source(), set()) |
+                       self.by_node.get(item.get_destination(), set()))
+        elif change == "remove_edge":
+            queries = set(self.by_edge.get(
+                (item.get_source(), item.get_destination()), ()))
+        else:
+            return
+        for query in queries:
+            self._drop(query)
+
+    def directed_dfs(self, start, end, max_total_dist, max_dist_outdoors):
+        """Same contract as ps2.directed_dfs, on the cached Digraph."""
+        query = (start, end, max_total_dist, max_dist_outdoors)
+        if query in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(query)
+            path = self.entries[query][0]
+        else:
+            self.misses += 1
+            touched = set()
+            found = constrained_shortest_path(self.digraph, start, end,
+                                              max_total_dist,
+                                              max_dist_outdoors,
+                                              stats={'touched': touched})
+            path = None if found is None else found[0]
+            nodes = [Node(name) for name in path or ()]
+            path_edges = set(zip(nodes, nodes[1:]))
+            self.entries[query] = (path, touched, path_edges)
+            for node in touched:
+                self.by_node[node].add(query)
+            for edge in path_edges:
+                self.by_edge[edge].add(query)
+            if len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+        if path is None:
+            raise ValueError("Not possible to satisfy max_total_dist and "
+                             "max_dist_outdoors")
+        return path[:]
+
+# Begin tests
+class TestRouteCache(unittest.TestCase):
+    LARGE_DIST = 99999
+
+    def setUp(self):
+        self.graph = load_map("mit_map.txt")
+        self.cache = RouteCache(self.graph, max_entries=4)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def find_edge(self, src, dest):
+        for edge in self.graph.get_edges_for_node(Node(src)):
+            if edge.get_destination() == Node(dest):
+                return edge
+
+    def test_hits_and_lru(self):
+        for _ in range(2):
+            self.assertEqual(self.cache.directed_dfs('32', '56',
+                                                     self.LARGE_DIST,
+                                                     self.LARGE_DIST),
+                             ['32', '56'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        for start in ('1', '2', '3', '4'):
+            self.cache.directed_dfs(start, '32', self.LARGE_DIST,
+                                    self.LARGE_DIST)
+        self.assertEqual(len(self.cache), 4)
+        self.assertNotIn(('32', '56', self.LARGE_DIST, self.LARGE_DIST),
+                         self.cache.entries)
+        # Evicted entries leave no empty sets behind in the index
+        live = set(self.cache.entries)
+        for index in (self.cache.by_node, self.cache.by_edge):
+            for queries in index.values():
+                self.assertTrue(queries)
+                self.assertLessEqual(queries, live)
+
+    def test_remove_edge_invalidates_routes_using_it(self):
+        self.cache.directed_dfs('32', '56', self.LARGE_DIST,
+                                self.LARGE_DIST)
+        self.cache.directed_dfs('2', '9', self.LARGE_DIST, 0)
+        self.graph.remove_edge(self.find_edge('32', '56'))
+        self.assertEqual(len(self.cache), 1)
+        self.assertNotEqual(self.cache.directed_dfs('32', '56',
+                                                    self.LARGE_DIST,
+                                                    self.LARGE_DIST),
+                            ['32', '56'])
+
+    def test_add_edge_invalidates_searches_reaching_it(self):
+        with self.assertRaises(ValueError):
+            self.cache.directed_dfs('8', '50', self.LARGE_DIST, 0)
+        self.cache.directed_dfs('32', '56', self.LARGE_DIST,
+                                self.LARGE_DIST)
+        self.graph.add_edge(WeightedEdge(Node('8'), Node('50'), 500, 0))
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.directed_dfs('8', '50', self.LARGE_DIST,
+                                                 0), ['8', '50'])
+
+    def test_matches_uncached_search_after_edits(self):
+        queries = [('1', '32', self.LARGE_DIST, 0),
+                   ('10', '50', self.LARGE_DIST, 30),
+                   ('2', '9', self.LARGE_DIST, self.LARGE_DIST)]
+        self.cache.max_entries = 10
+        for query in queries:
+            self.cache.directed_dfs(*query)
+        self.graph.remove_edge(self.find_edge('4', '12'))
+        self.graph.add_edge(WeightedEdge(Node('2'), Node('9'), 10, 0))
+        for query in queries:
+            self.assertEqual(self.cache.directed_dfs(*query),
+                             constrained_shortest_path(self.graph,
+                                                       *query)[0])
+
+if __name__ == "__main__":
+    unittest.main()
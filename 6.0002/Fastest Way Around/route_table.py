@@ -0,0 +1,319 @@
+# 6.0002 Problem Set 5
+# Graph optimization
+# Precomputed all-pairs route tables for repeated building queries
+
+import hashlib
+import heapq
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+from ps2 import (NO_LABEL, constrained_shortest_path, directed_dfs,
+                 load_compact_map)
+
+MAGIC = b"ROUTES1\n"
+# Distance stored for pairs that cannot be reached
+UNREACHABLE = -1
+
+def hash_map_file(map_filename):
+    """
+    Returns the SHA-256 digest (bytes) of the contents of a map file.
+    """
+    digest = hashlib.sha256()
+    with open(map_filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def _shortest_path_tree(compact, source, indoor_only):
+    """
+    Dijkstra search from source on a CompactDigraph, ordering paths by
+    total distance and then by outdoor distance.
+
+    Parameters:
+        compact: CompactDigraph instance
+        source: int, id of the node to start from
+        indoor_only: bool, if True edges with any outdoor distance are
+        not used
+
+    Returns:
+        a tuple (total, outdoor, first_hop) of lists indexed by node id.
+        first_hop[t] is the id of the node after source on the path to t,
+        source itself for t == source and UNREACHABLE when t cannot be
+        reached; total and outdoor hold UNREACHABLE for those nodes too.
+    """
+    n_nodes = compact.get_num_nodes()
+    total = [UNREACHABLE] * n_nodes
+    outdoor = [UNREACHABLE] * n_nodes
+    first_hop = [UNREACHABLE] * n_nodes
+    best = [(NO_LABEL, NO_LABEL)] * n_nodes
+    best[source] = (0, 0)
+    heap = [(0, 0, source, source)]
+    while heap:
+        node_total, node_outdoor, node, hop = heapq.heappop(heap)
+        if first_hop[node] != UNREACHABLE:
+            continue
+        total[node] = node_total
+        outdoor[node] = node_outdoor
+        first_hop[node] = hop
+        for dest, edge_total, edge_outdoor in compact.get_edges_for_node(
+                node):
+            if indoor_only and edge_outdoor:
+                continue
+            key = (node_total + edge_total, node_outdoor + edge_outdoor)
+            if key < best[dest]:
+                best[dest] = key
+                heapq.heappush(heap, key + (dest,
+                                            dest if node == source else hop))
+    return total, outdoor, first_hop
+
+class RouteTable(object):
+    """Represents precomputed all-pairs shortest paths of a map for two
+    objectives: shortest total distance, and shortest total distance
+    without walking outdoors. Each is a row-major n x n distance matrix
+    plus a next-hop matrix, so a path is rebuilt by following next hops
+    instead of searching."""
+    def __init__(self, map_hash, names, total, outdoor, next_hop,
+                 indoor_total, indoor_next_hop):
+        self.map_hash = map_hash
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.total = total
+        self.outdoor = outdoor
+        self.next_hop = next_hop
+        self.indoor_total = indoor_total
+        self.indoor_next_hop = indoor_next_hop
+
+    @classmethod
+    def build(cls, map_filename):
+        """Builds the tables for a map file by running one Dijkstra
+        search per building and objective."""
+        compact = load_compact_map(map_filename)
+        n_nodes = compact.get_num_nodes()
+        total = array('i')
+        outdoor = array('i')
+        next_hop = array('i')
+        indoor_total = array('i')
+        indoor_next_hop = array('i')
+        for source in range(n_nodes):
+            row_total, row_outdoor, row_hop = _shortest_path_tree(
+                compact, source, False)
+            total.extend(row_total)
+            outdoor.extend(row_outdoor)
+            next_hop.extend(row_hop)
+            row_total, _, row_hop = _shortest_path_tree(compact, source,
+                                                        True)
+            indoor_total.extend(row_total)
+            indoor_next_hop.extend(row_hop)
+        return cls(hash_map_file(map_filename), compact.names, total,
+                   outdoor, next_hop, indoor_total, indoor_next_hop)
+
+    @classmethod
+    def read(cls, table_filename):
+        """Reads tables written by save. Raises a ValueError if the file
+        is not a route table."""
+        with open(table_filename, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError("Not a route table file.")
+            map_hash = file.read(32)
+            counts = array('i')
+            counts.fromfile(file, 2)
+            n_nodes, names_size = counts
+            names = file.read(names_size).decode("utf-8").split("\n")
+            matrices = []
+            for _ in range(5):
+                matrix = array('i')
+                matrix.fromfile(file, n_nodes * n_nodes)
+                matrices.append(matrix)
+        if n_nodes == 0:
+            names = []
+        return cls(map_hash, names, *matrices)
+
+    def save(self, table_filename):
+        """Writes the tables to a binary file: a header with the map hash
+        and node names followed by the five matrices as native 32-bit
+        integers."""
+        names = "\n".join(self.names).encode("utf-8")
+        with open(table_filename, "wb") as file:
+            file.write(MAGIC)
+            file.write(self.map_hash)
+            array('i', [len(self.names), len(names)]).tofile(file)
+            file.write(names)
+            for matrix in (self.total, self.outdoor, self.next_hop,
+                           self.indoor_total, self.indoor_next_hop):
+                matrix.tofile(file)
+
+    def _trace(self, next_hop, start, end):
+        n_nodes = len(self.names)
+        path = [start]
+        node = start
+        while node != end:
+            node = next_hop[node * n_nodes + end]
+            path.append(node)
+        return [self.names[node] for node in path]
+
+    def find_path(self, start, end, max_total_dist, max_dist_outdoors):
+        """
+        Answers a directed_dfs query from the tables. The shortest path
+        is used when it stays within max_dist_outdoors and the indoor
+        path when max_dist_outdoors is 0. Any other outdoor limit that
+        the shortest path exceeds is not covered by the tables, and None
+        is returned so that the caller can search instead.
+
+        Returns:
+            The path as a list of building numbers (in strings), or None
+            if the tables cannot answer the query.
+
+            Raises a ValueError if start or end is not on the map, or if
+            the tables show that no path satisfies the constraints.
+        """
+        if start not in self.ids:
+            raise ValueError("Start not on digraph.")
+        elif end not in self.ids:
+            raise ValueError("End not on digraph.")
+        i = self.ids[start] * len(self.names) + self.ids[end]
+        if self.total[i] == UNREACHABLE:
+            raise ValueError("Not possible to satisfy max_total_dist and "
+                             "max_dist_outdoors")
+        if self.outdoor[i] <= max_dist_outdoors:
+            next_hop = self.next_hop
+            distance = self.total[i]
+        elif max_dist_outdoors == 0:
+            next_hop = self.indoor_next_hop
+            distance = self.indoor_total[i]
+        else:
+            return None
+        if distance == UNREACHABLE or distance > max_total_dist:
+            raise ValueError("Not possible to satisfy max_total_dist and "
+                             "max_dist_outdoors")
+        return self._trace(next_hop, self.ids[start], self.ids[end])
+
+def load_route_table(map_filename, table_filename=None):
+    """
+    Returns the RouteTable of a map file, reading it from table_filename
+    when that file was built from the current contents of the map and
+    rebuilding (and saving) it otherwise.
+
+    Parameters:
+        map_filename: name of the map file
+        table_filename: name of the cache file, OPTIONAL. Defaults to the
+        map file name followed by ".routes"
+    """
+    if table_filename is None:
+        table_filename = map_filename + ".routes"
+    map_hash = hash_map_file(map_filename)
+    if os.path.exists(table_filename):
+        try:
+            table = RouteTable.read(table_filename)
+        except (ValueError, EOFError):
+            table = None
+        if table is not None and table.map_hash == map_hash:
+            return table
+    table = RouteTable.build(map_filename)
+    table.save(table_filename)
+    return table
+
+class RouteService(object):
+    """Answers directed_dfs queries for a map file from its RouteTable,
+    searching the map only for outdoor limits the tables do not cover.
+    The tables are rebuilt when the map file changes."""
+    def __init__(self, map_filename, table_filename=None):
+        self.map_filename = map_filename
+        self.table_filename = table_filename
+        self.map_mtime = None
+        self.table = None
+        self.compact = None
+
+    def _refresh(self):
+        mtime = os.stat(self.map_filename).st_mtime_ns
+        if mtime != self.map_mtime:
+            self.table = load_route_table(self.map_filename,
+                                          self.table_filename)
+            self.compact = None
+            self.map_mtime = mtime
+
+    def directed_dfs(self, start, end, max_total_dist, max_dist_outdoors):
+        """Same contract as ps2.directed_dfs, on the current map file."""
+        self._refresh()
+        path = self.table.find_path(start, end, max_total_dist,
+                                    max_dist_outdoors)
+        if path is None:
+            if self.compact is None:
+                self.compact = load_compact_map(self.map_filename)
+            path = directed_dfs(self.compact, start, end, max_total_dist,
+                                max_dist_outdoors)
+        return path
+
+# Begin tests
+class TestRouteTable(unittest.TestCase):
+
+    def setUp(self):
+        # Route tables go to a scratch directory, not next to the maps
+        self.directory = tempfile.mkdtemp()
+        self.table_file = os.path.join(self.directory,
+                                       "test_load_map.txt.routes")
+        self.table = load_route_table("mit_map.txt", os.path.join(
+            self.directory, "mit_map.txt.routes"))
+        self.compact = load_compact_map("mit_map.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_search(self):
+        for start in self.table.names:
+            for end in self.table.names:
+                for outdoor_dist in (0, 99999):
+                    expected = constrained_shortest_path(
+                        self.compact, start, end, 99999, outdoor_dist)
+                    if expected is None:
+                        with self.assertRaises(ValueError):
+                            self.table.find_path(start, end, 99999,
+                                                 outdoor_dist)
+                        continue
+                    path = self.table.find_path(start, end, 99999,
+                                                outdoor_dist)
+                    self.assertEqual(path[0], start)
+                    self.assertEqual(path[-1], end)
+                    i = self.table.ids[start] * len(self.table.names)
+                    i += self.table.ids[end]
+                    if outdoor_dist:
+                        self.assertEqual(self.table.total[i], expected[1])
+                    else:
+                        self.assertEqual(self.table.indoor_total[i],
+                                         expected[1])
+
+    def test_test_routes(self):
+        self.assertEqual(self.table.find_path('2', '9', 99999, 0),
+                         ['2', '4', '10', '13', '9'])
+        self.assertEqual(self.table.find_path('1', '32', 99999, 99999),
+                         ['1', '4', '12', '32'])
+        self.assertIsNone(self.table.find_path('1', '32', 99999, 50))
+        with self.assertRaises(ValueError):
+            self.table.find_path('10', '32', 100, 99999)
+        with self.assertRaises(ValueError):
+            self.table.find_path('8', '50', 99999, 0)
+
+    def test_round_trip_and_rebuild(self):
+        table = load_route_table("test_load_map.txt", self.table_file)
+        read = RouteTable.read(self.table_file)
+        self.assertEqual(read.names, table.names)
+        self.assertEqual(read.total, table.total)
+        self.assertEqual(read.indoor_next_hop, table.indoor_next_hop)
+        read.map_hash = b"\0" * 32
+        read.save(self.table_file)
+        rebuilt = load_route_table("test_load_map.txt", self.table_file)
+        self.assertEqual(rebuilt.map_hash, table.map_hash)
+        self.assertEqual(rebuilt.find_path('a', 'd', 99999, 99999),
+                         ['a', 'b', 'c', 'd'])
+
+    def test_service(self):
+        service = RouteService("mit_map.txt", os.path.join(
+            self.directory, "mit_map.txt.routes"))
+        self.assertEqual(service.directed_dfs('10', '50', 99999, 30),
+                         ['10', '4', '2', '14', '50'])
+        self.assertEqual(service.directed_dfs('32', '56', 99999, 99999),
+                         ['32', '56'])
+
+if __name__ == "__main__":
+    unittest.main()
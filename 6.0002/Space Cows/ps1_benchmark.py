@@ -0,0 +1,410 @@
+# 6.0002 Problem Set 1: Space Cows
+# Benchmarks for the cow transport solvers on generated herds
+
+import argparse
+import csv
+import functools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from ps1a import (FILE_NAME, load_cows, load_herd, greedy_cow_transport,
+                  partition_cow_transport, branch_and_bound_cow_transport,
+                  subset_dp_cow_transport, subset_dp_memory,
+                  greedy_cow_report, best_fit_decreasing,
+                  worst_fit_decreasing, trips_lower_bound, measure_solver,
+                  parallel_cow_transport)
+from ps1b import EggTable
+
+LIMIT = 100
+HERD_SIZES = [10, 25, 50, 75, 100]
+HERDS_PER_SIZE = 10
+# Partition enumeration is only run on herds where it finishes in seconds
+PARTITION_MAX_COWS = 14
+DP_SIZES = [12, 14, 16, 18, 20]
+GREEDY_SIZES = [1000, 10000, 100000]
+EGG_WEIGHTS = [(1, 5, 10, 25), (1, 7, 23, 61, 199)]
+EGG_TARGETS = [100, 900, 10000, 100000, 10000000, 50000000]
+# The recursive dp_make_weight recurses once per unit of weight
+LEGACY_DP_MAX_TARGET = 900
+# Largest target the full table is filled to
+FULL_TABLE_MAX_TARGET = 100000
+PARALLEL_WORKERS = [1, 2, 4, 8, 16]
+# "thirds" herds on which the serial search takes a few seconds
+PARALLEL_HERDS = [(60, 4)]
+# The list-deleting greedy is quadratic, so it is skipped above this size
+LEGACY_GREEDY_MAX_COWS = 10000
+# Rows of the generated data file read by the loader benchmark
+LOAD_ROWS = 1000000
+
+# Weight distributions of the generated herds, each a function of a
+# random generator and the weight limit
+DISTRIBUTIONS = {
+    "uniform": lambda rng, limit: rng.randint(1, limit),
+    "light": lambda rng, limit: rng.randint(1, max(1, limit // 4)),
+    "heavy": lambda rng, limit: rng.randint(max(1, limit // 4), limit),
+    # About three cows a trip, the hardest herds for the exact solvers
+    "thirds": lambda rng, limit: min(limit, max(1, round(
+        rng.gauss(limit / 3, limit / 10)))),
+}
+# (name, solver, most cows it is run on or None) of the suite
+SOLVERS = [
+    ("first fit", greedy_cow_transport, None),
+    ("best fit", functools.partial(greedy_cow_transport,
+                                   heuristic=best_fit_decreasing), None),
+    ("worst fit", functools.partial(greedy_cow_transport,
+                                    heuristic=worst_fit_decreasing), None),
+    ("branch and bound", branch_and_bound_cow_transport, None),
+    ("subset dp", subset_dp_cow_transport, 16),
+    ("partition", partition_cow_transport, 12),
+]
+SUITE_SIZES = [10, 16, 50, 100]
+SUITE_SEEDS = 3
+TRIALS = 5
+# Seconds a solver gets per herd before it is reported as timed out
+TIMEOUT = 30
+ROW_FIELDS = ["distribution", "cows", "seed", "solver", "status", "trips",
+              "lower_bound", "gap", "min_seconds", "median_seconds",
+              "peak_bytes"]
+
+def make_herd(n_cows, limit=LIMIT, seed=0, distribution="uniform"):
+    """
+    Returns a dictionary of n_cows cow names and random weights between 1
+    and limit, drawn from one of DISTRIBUTIONS. The same seed always
+    gives the same herd.
+    """
+    rng = random.Random(seed)
+    weight = DISTRIBUTIONS[distribution]
+    return {"Cow{}".format(i): weight(rng, limit) for i in range(n_cows)}
+
+def legacy_greedy_cow_transport(cows, limit=10):
+    """greedy_cow_transport as it was before the heuristics shared a max
+    tree: one trip at a time, deleting cows from the middle of a list."""
+    remaining_cows = sorted([(v, k) for k, v in cows.items()],
+                             key=lambda x: x[0], reverse=True)
+    transported_cows = []
+    while remaining_cows:
+        trip_weight = 0
+        trip_cows = []
+        i = 0
+        while trip_weight < limit and i < len(remaining_cows):
+            if trip_weight + remaining_cows[i][0] <= limit:
+                trip_cows.append(remaining_cows[i][1])
+                trip_weight += remaining_cows[i][0]
+                del remaining_cows[i]
+            else:
+                i += 1
+        transported_cows.append(trip_cows)
+    return transported_cows
+
+def legacy_dp_make_weight(egg_weights, target_weight, memo):
+    """dp_make_weight as it was before EggTable: top-down recursion into
+    a dictionary memo."""
+    if target_weight == 0:
+        return memo[0]
+    try:
+        return memo[target_weight]
+    except KeyError:
+        result = []
+        for egg in egg_weights:
+            new_target_weight = target_weight - egg
+            if new_target_weight >= 0:
+                result.append(1 + legacy_dp_make_weight(
+                    egg_weights, new_target_weight, memo))
+        memo[target_weight] = min(result)
+        return memo[target_weight]
+
+def legacy_load_cows(filename):
+    """load_cows as it was before Herd: a dictionary filled line by
+    line."""
+    cows = {}
+    with open(filename, "r") as file:
+        for line in file:
+            name, weight = line.split(",")
+            cows[name] = int(weight)
+    return cows
+
+def time_solver(solver, cows, limit):
+    """Returns (number of trips, seconds) for one run of solver."""
+    start_time = time.perf_counter()
+    trips = solver(cows, limit)
+    return len(trips), time.perf_counter() - start_time
+
+def run_data_benchmark():
+    cows = load_cows(FILE_NAME)
+    print("{} (limit 10)".format(FILE_NAME))
+    print("{:>12} {:>6} {:>10}".format("solver", "trips", "seconds"))
+    for label, solver in (("greedy", greedy_cow_transport),
+                          ("partition", partition_cow_transport),
+                          ("b&b", branch_and_bound_cow_transport)):
+        trips, seconds = time_solver(solver, cows, 10)
+        print("{:>12} {:>6} {:>10.4f}".format(label, trips, seconds))
+
+def run_load_benchmark():
+    print("Loading {} rows".format(LOAD_ROWS))
+    print("{:>10} {:>14} {:>10}".format("loader", "rows/s", "MB"))
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "herd.txt")
+        with open(filename, "w") as file:
+            for i in range(LOAD_ROWS):
+                file.write("Cow{},{}\n".format(i, i % 1000 + 1))
+        for label, loader in (("dict", legacy_load_cows),
+                              ("Herd", load_herd)):
+            start_time = time.perf_counter()
+            cows = loader(filename)
+            seconds = time.perf_counter() - start_time
+            assert len(cows) == LOAD_ROWS
+            del cows
+            # A second, traced run gives the memory the loaded herd keeps
+            tracemalloc.start()
+            cows = loader(filename)
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del cows
+            print("{:>10} {:>14.0f} {:>10.1f}".format(
+                label, LOAD_ROWS / seconds, size / 2**20))
+
+def run_herd_benchmark():
+    print("Random herds, weights 1-{}, limit {}".format(LIMIT, LIMIT))
+    print("{:>6} {:>12} {:>12} {:>12} {:>12}".format(
+        "cows", "greedy trips", "b&b trips", "b&b median s",
+        "b&b max s"))
+    for n_cows in HERD_SIZES:
+        greedy_trips = 0
+        exact_trips = 0
+        seconds = []
+        for seed in range(HERDS_PER_SIZE):
+            cows = make_herd(n_cows, seed=seed)
+            greedy_trips += len(greedy_cow_transport(cows, LIMIT))
+            trips, elapsed = time_solver(branch_and_bound_cow_transport,
+                                         cows, LIMIT)
+            exact_trips += trips
+            seconds.append(elapsed)
+            if n_cows <= PARTITION_MAX_COWS:
+                assert time_solver(partition_cow_transport, cows,
+                                   LIMIT)[0] == trips
+        seconds.sort()
+        print("{:>6} {:>12.1f} {:>12.1f} {:>12.4f} {:>12.4f}".format(
+            n_cows, greedy_trips / HERDS_PER_SIZE,
+            exact_trips / HERDS_PER_SIZE, seconds[len(seconds) // 2],
+            seconds[-1]))
+
+def run_partition_benchmark():
+    print("Partition enumeration against branch and bound")
+    print("{:>6} {:>14} {:>10}".format("cows", "partition s", "b&b s"))
+    for n_cows in range(6, PARTITION_MAX_COWS + 1):
+        cows = make_herd(n_cows, seed=n_cows)
+        print("{:>6} {:>14.4f} {:>10.4f}".format(
+            n_cows, time_solver(partition_cow_transport, cows, LIMIT)[1],
+            time_solver(branch_and_bound_cow_transport, cows, LIMIT)[1]))
+
+def run_dp_benchmark():
+    print("Subset DP against branch and bound")
+    print("{:>6} {:>10} {:>10} {:>10}".format("cows", "DP MB", "DP s",
+                                               "b&b s"))
+    for n_cows in DP_SIZES:
+        cows = make_herd(n_cows, seed=n_cows)
+        trips, dp_seconds = time_solver(subset_dp_cow_transport, cows, LIMIT)
+        exact_trips, seconds = time_solver(branch_and_bound_cow_transport,
+                                           cows, LIMIT)
+        assert trips == exact_trips
+        print("{:>6} {:>10.1f} {:>10.4f} {:>10.4f}".format(
+            n_cows, subset_dp_memory(n_cows, LIMIT) / 2**20, dp_seconds,
+            seconds))
+
+def run_greedy_benchmark():
+    print("Greedy heuristics, gap to the lower bound")
+    print("{:>8} {:>22} {:>8} {:>6} {:>10}".format("cows", "heuristic",
+                                                  "trips", "gap",
+                                                  "seconds"))
+    for n_cows in GREEDY_SIZES:
+        cows = make_herd(n_cows, seed=n_cows)
+        report = greedy_cow_report(cows, LIMIT)
+        _, trips, gap, _ = report[0]
+        lower_bound = trips - gap
+        if n_cows <= LEGACY_GREEDY_MAX_COWS:
+            trips, seconds = time_solver(legacy_greedy_cow_transport, cows,
+                                         LIMIT)
+            report.append(("legacy greedy", trips, trips - lower_bound,
+                           seconds))
+        for name, trips, gap, seconds in report:
+            print("{:>8} {:>22} {:>8} {:>6} {:>10.4f}".format(
+                n_cows, name, trips, gap, seconds))
+
+def measure_with_timeout(solver, cows, limit, trials, timeout):
+    """
+    Runs measure_solver in a worker process so that a solver stuck on a
+    hard herd can be stopped. Returns its result, or None if it took more
+    than timeout seconds.
+    """
+    with multiprocessing.Pool(1) as pool:
+        result = pool.apply_async(measure_solver, (solver, cows, limit,
+                                                   trials))
+        try:
+            return result.get(timeout)
+        except multiprocessing.TimeoutError:
+            return None
+
+def run_suite(sizes=SUITE_SIZES, seeds=SUITE_SEEDS,
+              distributions=tuple(DISTRIBUTIONS), solvers=SOLVERS,
+              limit=LIMIT, trials=TRIALS, timeout=TIMEOUT):
+    """
+    Runs every solver on herds of every size, seed and distribution.
+
+    Parameters:
+        sizes: list of ints, herd sizes
+        seeds: int, number of herds (seeds 0, 1, ...) per size and
+        distribution
+        distributions: sequence of keys of DISTRIBUTIONS
+        solvers: list of (name, solver, most cows or None) tuples
+        limit: int, weight limit of the spaceship
+        trials: int, timed runs per solver and herd
+        timeout: int, seconds after which a solver is stopped
+
+    Returns:
+        A generator of rows, dicts with the keys of ROW_FIELDS. status is
+        "ok" or "timeout"; gap is the number of trips above
+        trips_lower_bound. Solvers are skipped on herds larger than their
+        most cows.
+    """
+    for distribution in distributions:
+        for n_cows in sizes:
+            for seed in range(seeds):
+                cows = make_herd(n_cows, limit, seed, distribution)
+                lower_bound = trips_lower_bound(list(cows.values()), limit)
+                for name, solver, max_cows in solvers:
+                    if max_cows is not None and n_cows > max_cows:
+                        continue
+                    row = dict.fromkeys(ROW_FIELDS)
+                    row.update(distribution=distribution, cows=n_cows,
+                               seed=seed, solver=name,
+                               lower_bound=lower_bound, status="timeout")
+                    result = measure_with_timeout(solver, cows, limit,
+                                                  trials, timeout)
+                    if result is not None:
+                        trips, seconds, peak = result
+                        row.update(status="ok", trips=trips,
+                                   gap=trips - lower_bound,
+                                   min_seconds=min(seconds),
+                                   median_seconds=statistics.median(
+                                       seconds),
+                                   peak_bytes=peak)
+                    yield row
+
+def print_row(row):
+    if row["status"] == "ok":
+        print("{:>8} {:>6} {:>4} {:>17} {:>6} {:>4} {:>10.4f} {:>10}".format(
+            row["distribution"], row["cows"], row["seed"], row["solver"],
+            row["trips"], row["gap"], row["median_seconds"],
+            row["peak_bytes"] // 1024))
+    else:
+        print("{:>8} {:>6} {:>4} {:>17} {:>6}".format(
+            row["distribution"], row["cows"], row["seed"], row["solver"],
+            row["status"]))
+
+def write_csv(rows, filename):
+    with open(filename, "w", newline="") as file:
+        writer = csv.DictWriter(file, ROW_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def write_json(rows, filename):
+    with open(filename, "w") as file:
+        json.dump(rows, file, indent=1)
+
+def run_parallel_benchmark():
+    print("Parallel search, {} cores".format(os.cpu_count()))
+    print("{:>6} {:>6} {:>8} {:>10} {:>8}".format("cows", "seed", "workers",
+                                                "seconds", "speedup"))
+    for n_cows, seed in PARALLEL_HERDS:
+        cows = make_herd(n_cows, seed=seed, distribution="thirds")
+        trips, serial = time_solver(branch_and_bound_cow_transport, cows,
+                                    LIMIT)
+        print("{:>6} {:>6} {:>8} {:>10.4f} {:>8.2f}".format(
+            n_cows, seed, "serial", serial, 1))
+        for workers in PARALLEL_WORKERS:
+            solver = functools.partial(parallel_cow_transport,
+                                       max_workers=workers)
+            parallel_trips, seconds = time_solver(solver, cows, LIMIT)
+            assert parallel_trips == trips
+            print("{:>6} {:>6} {:>8} {:>10.4f} {:>8.2f}".format(
+                n_cows, seed, workers, seconds, serial / seconds))
+
+def run_egg_benchmark():
+    print("Fewest eggs: recursion, full table and EggTable")
+    print("{:>20} {:>10} {:>11} {:>11} {:>11} {:>8}".format(
+        "egg weights", "target", "recursive s", "full s", "table s",
+        "size"))
+    for egg_weights in EGG_WEIGHTS:
+        for target in EGG_TARGETS:
+            times = []
+            if target <= LEGACY_DP_MAX_TARGET:
+                start_time = time.perf_counter()
+                legacy_dp_make_weight(egg_weights[::-1], target, {0: 0})
+                times.append(time.perf_counter() - start_time)
+            else:
+                times.append(None)
+            if target <= FULL_TABLE_MAX_TARGET:
+                start_time = time.perf_counter()
+                EggTable(egg_weights).extend(target)
+                times.append(time.perf_counter() - start_time)
+            else:
+                times.append(None)
+            table = EggTable(egg_weights)
+            start_time = time.perf_counter()
+            table.get_eggs(target)
+            times.append(time.perf_counter() - start_time)
+            print("{:>20} {:>10} {} {:>8}".format(
+                str(egg_weights), target, " ".join(
+                    "{:>11}".format("-" if seconds is None else
+                                    "{:.5f}".format(seconds))
+                    for seconds in times), table.get_size()))
+
+def run_comparisons():
+    run_data_benchmark()
+    run_load_benchmark()
+    run_partition_benchmark()
+    run_herd_benchmark()
+    run_dp_benchmark()
+    run_greedy_benchmark()
+    run_parallel_benchmark()
+    run_egg_benchmark()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark suite for the Space Cows solvers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SUITE_SIZES)
+    parser.add_argument("--seeds", type=int, default=SUITE_SEEDS)
+    parser.add_argument("--distributions", nargs="+",
+                        choices=sorted(DISTRIBUTIONS),
+                        default=list(DISTRIBUTIONS))
+    parser.add_argument("--trials", type=int, default=TRIALS)
+    parser.add_argument("--timeout", type=int, default=TIMEOUT)
+    parser.add_argument("--limit", type=int, default=LIMIT)
+    parser.add_argument("--csv", help="write the rows to this CSV file")
+    parser.add_argument("--json", help="write the rows to this JSON file")
+    parser.add_argument("--comparisons", action="store_true",
+                        help="run the fixed solver comparisons instead")
+    args = parser.parse_args()
+    if args.trials < 1:
+        parser.error("--trials must be at least 1")
+    if args.comparisons:
+        run_comparisons()
+    else:
+        print("{:>8} {:>6} {:>4} {:>17} {:>6} {:>4} {:>10} {:>10}".format(
+            "herd", "cows", "seed", "solver", "trips", "gap", "median s",
+            "peak KiB"))
+        rows = []
+        for row in run_suite(args.sizes, args.seeds, args.distributions,
+                             limit=args.limit, trials=args.trials,
+                             timeout=args.timeout):
+            print_row(row)
+            rows.append(row)
+        if args.csv:
+            write_csv(rows, args.csv)
+        if args.json:
+            write_json(rows, args.json)
@@ -14,3 +14,48 @@ def partitions(set_):
 def get_partitions(set_):
     for partition in partitions(set_):
         yield [list(elt) for elt in partition]
+
+def get_partitions_by_size(items, block_ok=None):
+    """
+    Yields the partitions of items with the fewest blocks first: every
+    partition into one block, then into two, and so on. Each partition
+    is built as a restricted growth string, item i going into one of the
+    blocks opened by items 0..i-1 or into a new one, so only the blocks
+    of the current partition are kept in memory.
+
+    Parameters:
+    items - an iterable of items
+    block_ok - a function taking a block (a list of items) and returning
+    whether it is allowed, OPTIONAL. It must reject every block that
+    contains a rejected block, since blocks are checked as they grow and
+    a rejected block is never extended.
+
+    Returns:
+    A generator of partitions, each a list of lists of items
+    """
+    items = list(items)
+    if not items:
+        yield []
+        return
+    blocks = []
+
+    def place(i, n_blocks):
+        if i == len(items):
+            yield [block[:] for block in blocks]
+            return
+        item = items[i]
+        # Items after this one must be able to open the missing blocks
+        if len(items) - i > n_blocks - len(blocks):
+            for block in blocks:
+                block.append(item)
+                if block_ok is None or block_ok(block):
+                    yield from place(i + 1, n_blocks)
+                block.pop()
+        if len(blocks) < n_blocks:
+            blocks.append([item])
+            if block_ok is None or block_ok(blocks[-1]):
+                yield from place(i + 1, n_blocks)
+            blocks.pop()
+
+    for n_blocks in range(1, len(items) + 1):
+        yield from place(0, n_blocks)
@@ -1,71 +1,193 @@
 # 6.0002 Problem Set 1a: Space Cows 
 
-from ps1_partition import get_partitions
+from ps1_partition import get_partitions_by_size
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                as_completed, wait)
+import bisect
+import heapq
+import multiprocessing
+import os
+import random
+import tempfile
 import time
-
+import tracemalloc
+import unittest
 FILE_NAME = "ps1_cow_data.txt"
+# Memory the subset DP planner may use for its tables, in bytes
+DP_MAX_MEMORY = 256 << 20
+# Most cows the subset DP planner accepts: its loop runs in pure Python
+# and already takes several seconds for 20 cows
+DP_MAX_COWS = 20
+
+class Herd(Mapping):
+    """Represents a herd read from a data file as two parallel columns, a
+    list of names and an array of 16-bit weights. Names are found with a
+    binary search on a sorted copy of the name list and an array of the
+    row of each, rather than with a dictionary. It reads like the
+    dictionary of name, weight pairs the transport functions take, for
+    less memory than that dictionary.
+
+    Rows that could not be loaded are kept for reporting: duplicates is a
+    list of (line number, name) pairs of names seen on an earlier line,
+    whose first weight is kept, and malformed a list of (line number,
+    line) pairs of lines that are not a name and a weight between 1 and
+    65535. Blank lines are skipped."""
+    def __init__(self):
+        self.names = []
+        self.weights = array('H')
+        # The names in sorted order, and the row of each
+        self.sorted_names = []
+        self.sorted_rows = array('I')
+        self.duplicates = []
+        self.malformed = []
+
+    def add_lines(self, lines, first_line_number=1):
+        """Loads name,weight lines, numbering them from
+        first_line_number."""
+        names = self.names
+        weights = self.weights
+        start = len(names)
+        # Line number of each row added by this call
+        line_numbers = array('Q')
+        for line_number, line in enumerate(lines, first_line_number):
+            values = line.split(",")
+            if len(values) != 2:
+                if line.strip():
+                    self.malformed.append((line_number, line.rstrip("\n")))
+                continue
+            name = values[0]
+            try:
+                weight = int(values[1])
+            except ValueError:
+                weight = 0
+            if not 0 < weight < 1 << 16 or not name:
+                self.malformed.append((line_number, line.rstrip("\n")))
+            else:
+                names.append(name)
+                weights.append(weight)
+                line_numbers.append(line_number)
+        self._index(start, line_numbers)
+
+    def _index(self, start, line_numbers):
+        """Sorts the rows by name, dropping and reporting as duplicates
+        the rows from start on whose name is on an earlier row."""
+        names = self.names
+        # The sort is stable, so the first row of a name comes first
+        order = sorted(range(len(names)), key=names.__getitem__)
+        dropped = [row for previous, row in zip(order, order[1:])
+                   if names[previous] == names[row]]
+        if dropped:
+            dropped.sort()
+            self.duplicates.extend((line_numbers[row - start], names[row])
+                                   for row in dropped)
+            dropped = set(dropped)
+            kept = [row for row in range(len(names)) if row not in dropped]
+            self.names = names = [names[row] for row in kept]
+            self.weights = array('H', [self.weights[row] for row in kept])
+            order = sorted(range(len(names)), key=names.__getitem__)
+        self.sorted_names = [names[row] for row in order]
+        self.sorted_rows = array('I', order)
+
+    def _find(self, name):
+        # Row of name, or None
+        i = bisect.bisect_left(self.sorted_names, name)
+        if i < len(self.sorted_names) and self.sorted_names[i] == name:
+            return self.sorted_rows[i]
+        return None
+
+    def __getitem__(self, name):
+        row = self._find(name)
+        if row is None:
+            raise KeyError(name)
+        return self.weights[row]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+def load_herd(filename):
+    """
+    Reads a data file of comma-separated cow name, weight pairs line by
+    line into a Herd, reporting duplicate names and malformed lines
+    instead of failing on them.
+
+    Parameters:
+    filename - the name of the data file as a string
+
+    Returns:
+    a Herd
+    """
+    herd = Herd()
+    with open(filename, "r") as file:
+        herd.add_lines(file)
+    return herd
 
 def load_cows(filename):
     """
     Read the contents of the given file. Assumes the file contents
     contain data in the form of comma-separated cow name, weight pairs,
-    and return a dictionary containing cow names as keys and
-    corresponding weights as values.
+    and return a Mapping (Herd) with cow names as keys and corresponding
+    weights as values.
 
     Parameters:
     filename - the name of the data file as a string
 
     Returns:
-    a dictionary of cow name (string), weight (int) pairs
+    a Mapping (Herd, see load_herd) of cow name (string), weight (int)
+    pairs, which also lists the lines it skipped
     """
-    cows = {}
-    with open(filename, "r") as file:
-        for line in file:
-             values = line.split(",")
-             cows[values[0]] = int(values[1])
-    return cows
+    return load_herd(filename)
 
-def greedy_cow_transport(cows,limit=10):
+def greedy_cow_transport(cows,limit=10,heuristic=None):
     """
     Uses a greedy heuristic to determine an allocation of cows that
     attempts to minimize the number of spaceship trips needed to
     transport all the cows. The returned allocation of cows may or may
-    not be optimal. Does not mutate the given dictionary of cows.
+    not be optimal. Does not mutate the given cows.
 
     Parameters:
-    cows - a dictionary of name (string), weight (int) pairs
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd
     limit - weight limit of the spaceship (an int)
+    heuristic - one of first_fit_decreasing (the default),
+    best_fit_decreasing or worst_fit_decreasing, OPTIONAL
     
     Returns:
     A list of lists, with each inner list containing the names of cows
     transported on a particular trip and the overall list containing all
-    the trips
+    the trips, or None if a cow is heavier than limit
     """
-    # Convert from dic to list of tuples and sort descending by value
-    remaining_cows = sorted([(v, k) for k, v in cows.items()],
-                             key=lambda x: x[0], reverse=True)
-    transported_cows = []
-    while remaining_cows:
-        trip_weight = 0
-        trip_cows = []
-        i = 0
-        while trip_weight < limit and i < len(remaining_cows):
-            if trip_weight + remaining_cows[i][0] <= limit:
-                trip_cows.append(remaining_cows[i][1])
-                trip_weight += remaining_cows[i][0]
-                del remaining_cows[i]
-            else:
-                i += 1
-        transported_cows.append(trip_cows)
+    if heuristic is None:
+        heuristic = first_fit_decreasing
+    names = sorted(cows, key=lambda name: cows[name], reverse=True)
+    weights = [cows[name] for name in names]
+    if weights and weights[0] > limit:
+        return None
+    assignment = heuristic(weights, limit)
+    transported_cows = [[] for _ in range(max(assignment, default=-1) + 1)]
+    for name, trip in zip(names, assignment):
+        transported_cows[trip].append(name)
     return transported_cows
 
-def brute_force_cow_transport(cows,limit=10):
+def partition_cow_transport(cows,limit=10):
     """
     Finds the allocation of cows that minimizes the number of spaceship
-    trips via brute force. Does not mutate the given dictionary of cows.
+    trips by enumerating partitions of the herd, fewest trips first, and
+    stopping at the first one where every trip is within limit. Trips
+    over the limit are never extended. Only practical for small herds;
+    kept as a reference for the exact solvers. Does not mutate the given
+    cows.
 
     Parameters:
-    cows - a dictionary of name (string), weight (int) pairs
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd
     limit - weight limit of the spaceship (an int)
     
     Returns:
@@ -73,41 +195,874 @@ def brute_force_cow_transport(cows,limit=10):
     transported on a particular trip and the overall list containing all
     the trips
     """
-    possible_allocations = sorted([x for x in get_partitions(cows.keys())],
-                             key=lambda x: len(x))
-    for allocation in possible_allocations:
-        good_allocation = True
-        for trip in allocation:
-            trip_weight = 0
-            for cow in trip:
-                trip_weight += cows[cow]
-            if trip_weight > limit:
-                good_allocation = False
+    def trip_ok(trip):
+        return sum(cows[cow] for cow in trip) <= limit
+
+    # Partitions come fewest trips first, so the first one is optimal
+    for allocation in get_partitions_by_size(cows.keys(), trip_ok):
+        return allocation
+
+def first_fit_decreasing(weights, limit):
+    """
+    Packs weights, sorted descending, into trips with the first-fit rule:
+    each weight goes on the first trip it fits on. The free space of the
+    trips is kept in a max tree, so finding that trip takes O(log n).
+
+    Parameters:
+    weights - a list of ints sorted descending, each at most limit
+    limit - weight limit of the spaceship (an int)
+
+    Returns:
+    A list with the trip index of each weight
+    """
+    size = 1
+    while size < len(weights):
+        size *= 2
+    # Leaves are trips, unopened ones being empty; inner nodes hold the
+    # most free space of the trips below them
+    free = [limit] * (2 * size)
+    assignment = []
+    for weight in weights:
+        node = 1
+        while node < size:
+            node *= 2
+            if free[node] < weight:
+                node += 1
+        assignment.append(node - size)
+        free[node] -= weight
+        node //= 2
+        while node:
+            free[node] = max(free[2 * node], free[2 * node + 1])
+            node //= 2
+    return assignment
+
+def best_fit_decreasing(weights, limit):
+    """
+    Packs weights, sorted descending, into trips with the best-fit rule:
+    each weight goes on the trip with the least free space that it fits
+    on, the first such trip on ties.
+
+    A trip whose free space is at least the k-th smallest distinct weight
+    but less than the next one goes in bucket k, a heap of (free space,
+    trip) pairs, and a tree over the buckets marks the nonempty ones. The
+    trips a weight fits on are those of its own bucket and above, so the
+    best one is the top of the first nonempty bucket from there, found in
+    O(log n).
+
+    Parameters:
+    weights - a list of ints sorted descending, each at most limit
+    limit - weight limit of the spaceship (an int)
+
+    Returns:
+    A list with the trip index of each weight
+    """
+    distinct = sorted(set(weights))
+    size = 1
+    while size < len(distinct):
+        size *= 2
+    buckets = [[] for _ in distinct]
+    # Leaves are buckets; inner nodes are 1 when a bucket below them has
+    # a trip
+    nonempty = bytearray(2 * size)
+
+    def update(bucket):
+        # Only the nodes whose value changes are rewritten
+        node = bucket + size
+        value = 1 if buckets[bucket] else 0
+        while node and nonempty[node] != value:
+            nonempty[node] = value
+            node //= 2
+            value = nonempty[2 * node] | nonempty[2 * node + 1]
+
+    def first_bucket(bucket):
+        # First nonempty bucket at or after bucket, or None
+        node = bucket + size
+        if nonempty[node]:
+            return bucket
+        while node > 1:
+            if not node & 1 and nonempty[node + 1]:
+                node += 1
+                while node < size:
+                    node *= 2
+                    if not nonempty[node]:
+                        node += 1
+                return node - size
+            node //= 2
+        return None
+
+    assignment = []
+    n_trips = 0
+    for weight in weights:
+        bucket = first_bucket(bisect.bisect_left(distinct, weight))
+        if bucket is None:
+            space, trip = limit, n_trips
+            n_trips += 1
+        else:
+            space, trip = heapq.heappop(buckets[bucket])
+        assignment.append(trip)
+        # Trips with less room than the lightest weight are full
+        new_bucket = bisect.bisect_right(distinct, space - weight) - 1
+        if new_bucket >= 0:
+            heapq.heappush(buckets[new_bucket], (space - weight, trip))
+        if new_bucket != bucket:
+            for changed in (bucket, new_bucket):
+                if changed is not None and changed >= 0:
+                    update(changed)
+    return assignment
+
+def worst_fit_decreasing(weights, limit):
+    """
+    Packs weights, sorted descending, into trips with the worst-fit rule:
+    each weight goes on the trip with the most free space, or on a new
+    trip if it does not fit there. The trips are kept in a heap.
+
+    Parameters:
+    weights - a list of ints sorted descending, each at most limit
+    limit - weight limit of the spaceship (an int)
+
+    Returns:
+    A list with the trip index of each weight
+    """
+    # (-free space, trip) pairs
+    heap = []
+    assignment = []
+    for weight in weights:
+        if heap and -heap[0][0] >= weight:
+            space, trip = heapq.heappop(heap)
+            heapq.heappush(heap, (space + weight, trip))
+        else:
+            trip = len(heap)
+            heapq.heappush(heap, (weight - limit, trip))
+        assignment.append(trip)
+    return assignment
+
+GREEDY_HEURISTICS = (first_fit_decreasing, best_fit_decreasing,
+                     worst_fit_decreasing)
+
+def trips_lower_bound(weights, limit):
+    """
+    Lower bound on the number of trips needed for weights: the larger of
+    the continuous bound L1 = ceil(total weight / limit) and the
+    Martello-Toth bound L2, which also counts the cows too heavy to share
+    a trip with each other. Takes O(n log n) time.
+
+    Parameters:
+    weights - a list of ints, each at most limit
+    limit - weight limit of the spaceship (an int)
+
+    Returns:
+    An int
+    """
+    weights = sorted(weights)
+    # prefix[i] is the weight of the i lightest cows
+    prefix = [0]
+    for w in weights:
+        prefix.append(prefix[-1] + w)
+    bound = -(-prefix[-1] // limit)
+    half = bisect.bisect_right(weights, limit // 2)
+    for alpha in set([0] + weights[:half]):
+        # Cows that cannot share a trip with any cow >= alpha
+        large = bisect.bisect_right(weights, limit - alpha)
+        heavy = len(weights) - large
+        # Space left next to the other cows heavier than limit / 2
+        large_count = large - half
+        large_free = large_count * limit - (prefix[large] - prefix[half])
+        # Cows between alpha and limit / 2
+        small_weight = prefix[half] - prefix[bisect.bisect_left(weights,
+                                                                alpha)]
+        overflow = max(0, small_weight - large_free)
+        bound = max(bound, heavy + large_count + -(-overflow // limit))
+    return bound
+
+def greedy_cow_report(cows, limit=10, heuristics=GREEDY_HEURISTICS):
+    """
+    Runs each greedy heuristic on cows and compares its number of trips
+    with trips_lower_bound, so the quality of an allocation is known
+    without solving the herd exactly.
+
+    Parameters:
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd, each at most limit
+    limit - weight limit of the spaceship (an int)
+    heuristics - a sequence of heuristics taken by greedy_cow_transport,
+    OPTIONAL
+
+    Returns:
+    A list of (heuristic name, trips, gap, seconds) tuples, where gap is
+    the number of trips above the lower bound (0 means optimal)
+    """
+    lower_bound = trips_lower_bound(list(cows.values()), limit)
+    report = []
+    for heuristic in heuristics:
+        start = time.perf_counter()
+        trips = len(greedy_cow_transport(cows, limit, heuristic))
+        seconds = time.perf_counter() - start
+        report.append((heuristic.__name__, trips, trips - lower_bound,
+                       seconds))
+    return report
+
+def _is_dominated(values, counts, chosen, free):
+    """
+    Tells whether a trip can be improved by swapping some of its cows for
+    one cow still waiting: if a set of two or more cows on the trip weighs
+    no more than a waiting cow that fits in their place, or a single cow
+    weighs less than one, the swapped trip wastes less space and leaves
+    lighter cows behind, so it is at least as good.
+
+    Parameters:
+    values - list of the distinct weights, descending
+    counts - list of the number of waiting cows of each weight
+    chosen - list of indexes into values of the cows on the trip, besides
+    the heaviest cow that opened it
+    free - space left on the trip (an int)
+
+    Returns:
+    True if the trip is dominated, False otherwise
+    """
+    # Bit s of singles is set when one chosen cow weighs s, and bit s of
+    # groups when two or more of them together weigh s
+    singles = 0
+    groups = 0
+    for index in chosen:
+        groups |= (singles | groups) << values[index]
+        singles |= 1 << values[index]
+    for index, count in enumerate(counts):
+        if count == 0:
+            continue
+        weight = values[index]
+        low = max(0, weight - free)
+        window = (1 << (weight - low + 1)) - 1
+        if (groups >> low) & window or (singles >> low) & (window >> 1):
+            return True
+    return False
+
+def _trip_completions(values, counts, start, free, budget):
+    """
+    Lists the ways to fill the space left on a trip with waiting cows,
+    keeping only the trips no waiting cow fits on, that waste at most
+    budget and that are not dominated.
+
+    Parameters:
+    values - list of the distinct weights, descending
+    counts - list of the number of waiting cows of each weight
+    start - index into values of the heaviest weight that may be added
+    free - space left on the trip (an int)
+    budget - space the remaining trips may waste in total (an int)
+
+    Returns:
+    A list of (waste, chosen) tuples, least waste first, where chosen is
+    a list of indexes into values
+    """
+    completions = []
+    chosen = []
+
+    def extend(start, free):
+        if free <= budget:
+            lightest = len(values) - 1
+            while lightest >= 0 and counts[lightest] == 0:
+                lightest -= 1
+            if (lightest < 0 or values[lightest] > free) and \
+                    not _is_dominated(values, counts, chosen, free):
+                completions.append((free, chosen[:]))
+        for index in range(start, len(values)):
+            if counts[index] and values[index] <= free:
+                counts[index] -= 1
+                chosen.append(index)
+                extend(index, free - values[index])
+                chosen.pop()
+                counts[index] += 1
+
+    extend(start, free)
+    completions.sort(key=lambda completion: completion[0])
+    return completions
+
+class _SearchStopped(Exception):
+    """Raised by a _TripSearch whose stop function returns True."""
+
+class _TripSearch(object):
+    """Bin completion search over the number of waiting cows of each
+    distinct weight, remembering the states shown to have no allocation
+    so that later searches on the same herd skip them too."""
+    def __init__(self, values, counts, limit, stop=None):
+        self.values = values
+        self.counts = list(counts)
+        self.limit = limit
+        self.stop = stop
+        # (trips left, counts) states known to have no allocation
+        self.failed = set()
+
+    def search(self, trips_left, budget):
+        """
+        Packs the waiting cows into trips_left trips, wasting at most
+        budget space in total.
+
+        Returns:
+        A list of trips, each a list of indexes into values, or None if
+        there is no such allocation. Raises _SearchStopped if stop
+        returned True.
+        """
+        values = self.values
+        counts = self.counts
+        if self.stop is not None and self.stop():
+            raise _SearchStopped()
+        heaviest = 0
+        while heaviest < len(values) and counts[heaviest] == 0:
+            heaviest += 1
+        if heaviest == len(values):
+            return []
+        if trips_left == 0:
+            return None
+        state = (trips_left, tuple(counts))
+        if state in self.failed:
+            return None
+        counts[heaviest] -= 1
+        try:
+            for waste, chosen in _trip_completions(
+                    values, counts, heaviest,
+                    self.limit - values[heaviest], budget):
+                for index in chosen:
+                    counts[index] -= 1
+                try:
+                    rest = self.search(trips_left - 1, budget - waste)
+                finally:
+                    for index in chosen:
+                        counts[index] += 1
+                if rest is not None:
+                    return [[heaviest] + chosen] + rest
+        finally:
+            counts[heaviest] += 1
+        self.failed.add(state)
+        return None
+
+def _first_fit_trips(names, weights, limit):
+    assignment = first_fit_decreasing(weights, limit)
+    trips = [[] for _ in range(max(assignment, default=-1) + 1)]
+    for name, trip in zip(names, assignment):
+        trips[trip].append(name)
+    return trips
+
+def _named_trips(found, values, names, weights):
+    """Turns trips of indexes into values back into trips of names."""
+    by_weight = {value: [] for value in values}
+    for name, weight in zip(names, weights):
+        by_weight[weight].append(name)
+    return [[by_weight[values[index]].pop() for index in trip]
+            for trip in found]
+
+def branch_and_bound_cow_transport(cows,limit=10):
+    """
+    Finds the allocation of cows that minimizes the number of spaceship
+    trips with a branch and bound search over whole trips (Korf's bin
+    completion). Does not mutate the given cows.
+
+    The first-fit decreasing allocation is the starting upper bound and
+    trips_lower_bound the starting lower bound. For each number of trips
+    in between, the search fills one trip at a time: the heaviest waiting
+    cow opens it and it is completed in every way that leaves no room for
+    another cow, least wasted space first. Cows of equal weight are
+    interchangeable, so only their counts are searched. A branch is cut
+    when the trips so far waste more space than the number of trips
+    allows, when the trip is dominated (see _is_dominated), or when the
+    waiting cows were already found not to fit in the trips left, which
+    happens often since different first trips can leave the same cows.
+
+    Parameters:
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd
+    limit - weight limit of the spaceship (an int)
+    
+    Returns:
+    A list of lists, with each inner list containing the names of cows
+    transported on a particular trip and the overall list containing all
+    the trips, or None if a cow is heavier than limit
+    """
+    names = sorted(cows, key=lambda name: cows[name], reverse=True)
+    weights = [cows[name] for name in names]
+    if weights and weights[0] > limit:
+        return None
+    trips = _first_fit_trips(names, weights, limit)
+    values = sorted(set(weights), reverse=True)
+    searcher = _TripSearch(values, [weights.count(value)
+                                    for value in values], limit)
+    total = sum(weights)
+    lower_bound = trips_lower_bound(weights, limit) if weights else 0
+    for n_trips in range(lower_bound, len(trips)):
+        found = searcher.search(n_trips, n_trips * limit - total)
+        if found is not None:
+            return _named_trips(found, values, names, weights)
+    return trips
+
+# State of the processes of parallel_cow_transport
+_worker_searcher = None
+_worker_counts = None
+_worker_total = None
+_worker_best = None
+
+def _init_trip_worker(values, counts, limit, total, best):
+    global _worker_searcher, _worker_counts, _worker_total, _worker_best
+    _worker_searcher = _TripSearch(values, counts, limit)
+    _worker_counts = counts
+    _worker_total = total
+    _worker_best = best
+
+def _search_after_first_trip(n_trips, waste, chosen):
+    """
+    Searches the allocations into n_trips trips whose first trip holds
+    the heaviest cow and the cows of chosen, giving up as soon as another
+    worker finds an allocation into n_trips trips or fewer.
+
+    Returns:
+    A tuple (n_trips, trips), trips being a list of trips of indexes into
+    values or None if there is no such allocation or the search gave up.
+    """
+    searcher = _worker_searcher
+    searcher.counts = list(_worker_counts)
+    searcher.counts[0] -= 1
+    for index in chosen:
+        searcher.counts[index] -= 1
+    searcher.stop = lambda: _worker_best.value <= n_trips
+    budget = n_trips * searcher.limit - _worker_total - waste
+    try:
+        rest = searcher.search(n_trips - 1, budget)
+    except _SearchStopped:
+        return n_trips, None
+    if rest is None:
+        return n_trips, None
+    with _worker_best.get_lock():
+        _worker_best.value = min(_worker_best.value, n_trips)
+    return n_trips, [[0] + chosen] + rest
+
+def parallel_cow_transport(cows,limit=10,max_workers=None):
+    """
+    Finds the allocation of cows that minimizes the number of spaceship
+    trips with the search of branch_and_bound_cow_transport, split
+    across worker processes. Does not mutate the given cows.
+
+    Each task is a number of trips between the lower and upper bounds
+    and one way to fill the first trip. Tasks are submitted fewest trips
+    first, a few per worker at a time, and the workers share the fewest
+    trips found so far: a task gives up as soon as it can no longer beat
+    it, and tasks that cannot beat it are never submitted. The number of
+    trips is the same as branch_and_bound_cow_transport, though the
+    allocation may differ.
+
+    Parameters:
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd
+    limit - weight limit of the spaceship (an int)
+    max_workers - number of worker processes, os.cpu_count() by default
+    
+    Returns:
+    A list of lists, with each inner list containing the names of cows
+    transported on a particular trip and the overall list containing all
+    the trips, or None if a cow is heavier than limit
+    """
+    names = sorted(cows, key=lambda name: cows[name], reverse=True)
+    weights = [cows[name] for name in names]
+    if weights and weights[0] > limit:
+        return None
+    trips = _first_fit_trips(names, weights, limit)
+    lower_bound = trips_lower_bound(weights, limit) if weights else 0
+    if lower_bound == len(trips):
+        return trips
+    values = sorted(set(weights), reverse=True)
+    counts = [weights.count(value) for value in values]
+    total = sum(weights)
+    best = multiprocessing.Value('i', len(trips))
+    found = None
+
+    def collect(futures):
+        nonlocal found
+        for future in futures:
+            n_trips, task_found = future.result()
+            if task_found is not None and (found is None or
+                                           n_trips < len(found)):
+                found = task_found
+
+    # The heaviest cow opens the first trip
+    waiting = counts[:]
+    waiting[0] -= 1
+    tasks = ((n_trips, waste, chosen)
+             for n_trips in range(lower_bound, len(trips))
+             for waste, chosen in _trip_completions(
+                 values, waiting, 0, limit - values[0],
+                 n_trips * limit - total))
+    window = 2 * (max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers, initializer=_init_trip_worker,
+                             initargs=(values, counts, limit, total,
+                                       best)) as executor:
+        pending = set()
+        for n_trips, waste, chosen in tasks:
+            # Tasks come fewest trips first, so none left can beat best
+            if n_trips >= best.value:
                 break
-        if good_allocation:
-            return allocation
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(_search_after_first_trip, n_trips,
+                                        waste, chosen))
+        collect(as_completed(pending))
+    if found is None:
+        return trips
+    return _named_trips(found, values, names, weights)
+
+def _subset_dp_typecode(n_cows, limit):
+    """
+    Returns the array type code of the subset DP states, whose largest
+    value is n_cows * (limit + 1) + limit: 'i' when it fits in 32 bits,
+    'q' otherwise. Raises a ValueError if it does not fit in 64 bits.
+    """
+    largest = n_cows * (limit + 1) + limit
+    for typecode in ('i', 'q'):
+        if largest < 1 << (8 * array(typecode).itemsize - 1):
+            return typecode
+    raise ValueError("Subset DP states for a limit of {} do not fit in "
+                     "64 bits.".format(limit))
+
+def subset_dp_memory(n_cows, limit=10):
+    """
+    Returns the memory in bytes taken by the tables of
+    subset_dp_cow_transport for a herd of n_cows cows: for each of the
+    2**n_cows subsets, a 4 byte state (8 bytes for very large limits) and
+    a 1 byte cow index.
+    """
+    state_size = array(_subset_dp_typecode(n_cows, limit)).itemsize
+    return (1 << n_cows) * (state_size + array('B').itemsize)
+
+def subset_dp_cow_transport(cows,limit=10,max_memory=DP_MAX_MEMORY,
+                            max_cows=DP_MAX_COWS):
+    """
+    Finds the allocation of cows that minimizes the number of spaceship
+    trips with a dynamic program over subsets of the herd. Does not
+    mutate the given cows.
+
+    The state of a subset is the best (trips, load of the last trip)
+    pair for loading exactly those cows one at a time, a cow going on
+    the last trip if it fits and on a new trip otherwise. It is the best
+    state of the subset without some cow, plus that cow. The tables hold
+    each state as trips * (limit + 1) + load, and the cow added last to
+    rebuild the allocation. Unlike branch and bound, the running time
+    only depends on the number of cows: it is O(2**n * n), which is
+    practical up to about 20 cows (several seconds), the default
+    max_cows.
+
+    Parameters:
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd
+    limit - weight limit of the spaceship (an int)
+    max_memory - most bytes the tables may take (an int), OPTIONAL
+    max_cows - most cows in the herd (an int), OPTIONAL
+    
+    Returns:
+    A list of lists, with each inner list containing the names of cows
+    transported on a particular trip and the overall list containing all
+    the trips, or None if a cow is heavier than limit
+
+    Raises a ValueError if the herd has more than max_cows cows, if the
+    tables would take more than max_memory bytes (see subset_dp_memory),
+    or if limit is too large for the states to fit in 64 bits.
+    """
+    names = list(cows)
+    weights = [cows[name] for name in names]
+    n_cows = len(names)
+    if n_cows > max_cows:
+        raise ValueError("Subset DP for {} cows would take too long, more "
+                         "than max_cows ({}).".format(n_cows, max_cows))
+    needed = subset_dp_memory(n_cows, limit)
+    if needed > max_memory:
+        raise ValueError("Subset DP for {} cows needs {} bytes, more than "
+                         "max_memory ({}).".format(n_cows, needed,
+                                                   max_memory))
+    if any(weight > limit for weight in weights):
+        return None
+    span = limit + 1
+    # The empty herd needs no trip but leaves no room on the last one
+    state = array(_subset_dp_typecode(n_cows, limit), [0]) * (1 << n_cows)
+    state[0] = limit
+    last_cow = array('B', [0]) * (1 << n_cows)
+    for subset in range(1, 1 << n_cows):
+        best = None
+        rest = subset
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            cow = bit.bit_length() - 1
+            before = state[subset ^ bit]
+            load = before % span
+            weight = weights[cow]
+            if load + weight <= limit:
+                after = before + weight
+            else:
+                after = before - load + span + weight
+            if best is None or after < best:
+                best = after
+                best_cow = cow
+        state[subset] = best
+        last_cow[subset] = best_cow
+    order = []
+    subset = (1 << n_cows) - 1
+    while subset:
+        order.append(last_cow[subset])
+        subset ^= 1 << last_cow[subset]
+    trips = []
+    load = limit
+    for cow in reversed(order):
+        if load + weights[cow] > limit:
+            trips.append([])
+            load = 0
+        trips[-1].append(names[cow])
+        load += weights[cow]
+    return trips
 
-def compare_cow_transport_algorithms():
+def brute_force_cow_transport(cows,limit=10,max_workers=1):
     """
-    Using the data from ps1_cow_data.txt and the specified weight limit, runs
+    Finds the allocation of cows that minimizes the number of spaceship
+    trips. Does not mutate the given cows.
+
+    The search is exact: it uses branch_and_bound_cow_transport rather
+    than enumerating partitions, which handles herds of a hundred cows,
+    or parallel_cow_transport when more than one worker is asked for.
+
+    Parameters:
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd
+    limit - weight limit of the spaceship (an int)
+    max_workers - number of worker processes (an int), or None for
+    os.cpu_count(), OPTIONAL
+    
+    Returns:
+    A list of lists, with each inner list containing the names of cows
+    transported on a particular trip and the overall list containing all
+    the trips
+    """
+    if max_workers == 1:
+        return branch_and_bound_cow_transport(cows, limit)
+    return parallel_cow_transport(cows, limit, max_workers)
+
+def measure_solver(solver, cows, limit=10, trials=5):
+    """
+    Times a cow transport solver and measures its memory.
+
+    Parameters:
+    solver - a function taking cows and limit, such as
+    greedy_cow_transport
+    cows - a Mapping of name (string), weight (int) pairs, such as a
+    dictionary or a Herd
+    limit - weight limit of the spaceship (an int)
+    trials - number of timed runs (an int), at least 1
+
+    Returns:
+    A tuple (trips, seconds, peak), where trips is the number of trips
+    found, seconds a list of the running times of the trials measured
+    with time.perf_counter, and peak the most bytes allocated during one
+    more run traced with tracemalloc (tracing slows the solver down, so
+    that run is not timed).
+
+    Raises a ValueError if trials is less than 1.
+    """
+    if trials < 1:
+        raise ValueError("trials must be at least 1.")
+    seconds = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        trips = solver(cows, limit)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        solver(cows, limit)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return len(trips), seconds, peak
+
+def compare_cow_transport_algorithms(filename=FILE_NAME, limit=10, trials=5):
+    """
+    Using the data from filename and the specified weight limit, runs
     greedy_cow_transport and brute_force_cow_transport functions. Print
-    out the number of trips returned by each method, and how long each
-    method takes to run in seconds.
+    out the number of trips returned by each method, the best and median
+    running time of trials runs in seconds, and the peak memory of each
+    method. ps1_benchmark.py runs the solvers on generated herds.
 
     Returns:
     Does not return anything.
     """
-    cows = load_cows(FILE_NAME)
-    start = time.time()
-    greedy_solution = greedy_cow_transport(cows)
-    end = time.time()
-    print("The greedy solution run in", end-start, "and solved with",
-          len(greedy_solution), "trips.")
-    start = time.time()
-    brute_solution = brute_force_cow_transport(cows)
-    end = time.time()
-    print("The brute solution run in", end-start, "and solved with",
-          len(brute_solution), "trips.")
+    cows = load_cows(filename)
+    for label, solver in (("greedy", greedy_cow_transport),
+                          ("brute", brute_force_cow_transport)):
+        trips, seconds, peak = measure_solver(solver, cows, limit, trials)
+        seconds.sort()
+        print("The {} solution run in {:.6f} (median {:.6f}) seconds, "
+              "peaked at {} KiB and solved with {} trips.".format(
+                  label, seconds[0], seconds[len(seconds) // 2],
+                  peak // 1024, trips))
+
+# Begin tests
+class TestLoadHerd(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.filename = tempfile.mkstemp(suffix=".txt")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def write(self, text):
+        with open(self.filename, "w") as file:
+            file.write(text)
+
+    def test_matches_dictionary(self):
+        herd = load_herd(FILE_NAME)
+        cows = {}
+        with open(FILE_NAME) as file:
+            for line in file:
+                name, weight = line.split(",")
+                cows[name] = int(weight)
+        self.assertEqual(dict(herd), cows)
+        self.assertEqual(list(herd), list(cows))
+        self.assertEqual((herd.duplicates, herd.malformed), ([], []))
+        self.assertEqual(greedy_cow_transport(herd), greedy_cow_transport(cows))
+        self.assertEqual(len(brute_force_cow_transport(herd)), 5)
+
+    def test_reports_bad_lines(self):
+        self.write("Maggie,3\nHerman,7\n\nMaggie,4\nBetsy\nOreo,six\n"
+                   "Lola,70000\nMilkshake,0\n,2\nMillie,5\n\n")
+        herd = load_herd(self.filename)
+        self.assertEqual(dict(herd), {"Maggie": 3, "Herman": 7, "Millie": 5})
+        self.assertEqual(herd.duplicates, [(4, "Maggie")])
+        self.assertEqual([line_number for line_number, _ in herd.malformed],
+                         [5, 6, 7, 8, 9])
+        self.assertEqual(herd.malformed[0], (5, "Betsy"))
+
+    def test_add_lines_twice(self):
+        herd = Herd()
+        herd.add_lines(["Maggie,3\n", "Herman,7\n"])
+        herd.add_lines(["Betsy,9\n", "Maggie,4\n", "Betsy,1\n"], 3)
+        self.assertEqual(list(herd.items()), [("Maggie", 3), ("Herman", 7),
+                                              ("Betsy", 9)])
+        self.assertEqual(herd.duplicates, [(4, "Maggie"), (5, "Betsy")])
+        self.assertNotIn("Oreo", herd)
+        with self.assertRaises(KeyError):
+            herd["Oreo"]
+
+def random_herd(seed, n_cows, limit=10):
+    """Returns a dictionary of n_cows cows with weights from 1 to limit."""
+    rng = random.Random(seed)
+    return {"Cow%d" % i: rng.randint(1, limit) for i in range(n_cows)}
+
+def check_trips(test, trips, cows, limit):
+    """Checks that trips take every cow once and stay within limit."""
+    test.assertEqual(sorted(name for trip in trips for name in trip),
+                     sorted(cows))
+    for trip in trips:
+        test.assertLessEqual(sum(cows[name] for name in trip), limit)
+
+class TestBranchAndBound(unittest.TestCase):
+
+    def test_matches_partitions(self):
+        for seed in range(20):
+            limit = 10 + seed % 3
+            cows = random_herd(seed, 6 + seed % 3, limit)
+            trips = branch_and_bound_cow_transport(cows, limit)
+            check_trips(self, trips, cows, limit)
+            self.assertEqual(len(trips),
+                             len(partition_cow_transport(cows, limit)))
+
+    def test_cow_over_limit(self):
+        cows = {"Maggie": 3, "Herman": 11, "Betsy": 9}
+        self.assertIsNone(branch_and_bound_cow_transport(cows, 10))
+
+    def test_empty_herd(self):
+        self.assertEqual(branch_and_bound_cow_transport({}, 10), [])
+        self.assertEqual(branch_and_bound_cow_transport(Herd(), 10), [])
+
+def plain_fit_decreasing(weights, limit, choose):
+    """
+    Packs weights into trips in O(n**2) time, putting each weight on the
+    trip choose(fits, free) picks among the trips it fits on, or on a new
+    trip if there are none. Returns the trip index of each weight.
+    """
+    free = []
+    assignment = []
+    for weight in weights:
+        fits = [trip for trip, space in enumerate(free) if space >= weight]
+        if fits:
+            trip = choose(fits, free)
+        else:
+            trip = len(free)
+            free.append(limit)
+        free[trip] -= weight
+        assignment.append(trip)
+    return assignment
+
+class TestFitDecreasing(unittest.TestCase):
+
+    RULES = [
+        (first_fit_decreasing, lambda fits, free: fits[0]),
+        (best_fit_decreasing,
+         lambda fits, free: min(fits, key=lambda trip: free[trip])),
+        (worst_fit_decreasing,
+         lambda fits, free: max(fits, key=lambda trip: (free[trip], -trip))),
+    ]
+
+    def test_matches_plain_fit(self):
+        for seed in range(40):
+            rng = random.Random(seed)
+            limit = rng.choice([10, 17, 100, 1000])
+            weights = sorted((rng.randint(1, limit)
+                              for _ in range(rng.randint(0, 200))),
+                             reverse=True)
+            for heuristic, choose in self.RULES:
+                self.assertEqual(heuristic(weights, limit),
+                                 plain_fit_decreasing(weights, limit, choose),
+                                 (heuristic.__name__, seed))
+
+    def test_lower_bound(self):
+        for seed in range(40):
+            limit = 10 + seed % 11
+            cows = random_herd(seed, 5 + seed % 10, limit)
+            weights = sorted(cows.values(), reverse=True)
+            optimum = len(branch_and_bound_cow_transport(cows, limit))
+            self.assertLessEqual(trips_lower_bound(weights, limit), optimum)
+            for heuristic in GREEDY_HEURISTICS:
+                self.assertGreaterEqual(
+                    max(heuristic(weights, limit)) + 1, optimum)
+
+class TestParallel(unittest.TestCase):
+
+    # (seed, cows, limit) of herds where first fit misses the lower bound,
+    # so that the workers run; four of them beat first fit
+    HERDS = [(28, 12, 17), (74, 10, 10), (124, 12, 100), (39, 10, 100),
+             (146, 10, 10), (232, 12, 10)]
+
+    def test_matches_branch_and_bound(self):
+        for seed, n_cows, limit in self.HERDS:
+            cows = random_herd(seed, n_cows, limit)
+            trips = parallel_cow_transport(cows, limit, max_workers=2)
+            check_trips(self, trips, cows, limit)
+            self.assertEqual(len(trips),
+                             len(branch_and_bound_cow_transport(cows, limit)))
+        self.assertIsNone(parallel_cow_transport({"Herman": 11}, 10))
+
+class TestSubsetDP(unittest.TestCase):
+
+    def test_matches_branch_and_bound(self):
+        for seed in range(30):
+            limit = 10 + seed % 7
+            cows = random_herd(seed, 1 + seed % 12, limit)
+            trips = subset_dp_cow_transport(cows, limit)
+            check_trips(self, trips, cows, limit)
+            self.assertEqual(len(trips),
+                             len(branch_and_bound_cow_transport(cows, limit)))
+
+    def test_limits(self):
+        cows = random_herd(0, 12)
+        self.assertEqual(subset_dp_cow_transport({}, 10), [])
+        self.assertIsNone(subset_dp_cow_transport({"Herman": 11}, 10))
+        with self.assertRaises(ValueError):
+            subset_dp_cow_transport(cows, 10, max_cows=11)
+        with self.assertRaises(ValueError):
+            subset_dp_cow_transport(cows, 10,
+                                    max_memory=subset_dp_memory(12) - 1)
 
 if __name__ == "__main__":
-    compare_cow_transport_algorithms()
\ No newline at end of file
+    compare_cow_transport_algorithms()
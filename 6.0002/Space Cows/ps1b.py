@@ -1,33 +1,546 @@
 # 6.0002 Problem Set 1b: Space Change
 
-def dp_make_weight(egg_weights, target_weight, memo = {0:0}):
+import contextlib
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+from array import array
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of eggs stored for weights that cannot be made
+UNREACHABLE = -1
+# Fewest new weights EggTable.extend fills with NumPy, when installed:
+# below this the per-egg array operations cost more than the Python loop
+NUMPY_MIN_WEIGHTS = 200
+
+class EggTable(object):
+    """Represents the fewest eggs needed for every weight from 0 up to
+    some size, for one set of egg weights. The table is filled bottom-up
+    in arrays and grows when a larger weight is asked for, so a weight is
+    never computed twice.
+
+    Large weights never need a large table. Some composition with the
+    fewest eggs has fewer than heaviest copies of every lighter egg, or
+    heaviest copies of it could be swapped for fewer of the heaviest
+    egg. So above (heaviest - 1) * (sum of the lighter eggs), the
+    heaviest egg is always used and the weight can be reduced by it. And
+    when greedy is optimal for the egg weights (as for coins 1, 5, 10,
+    25), weights are answered without the table at all."""
+    def __init__(self, egg_weights):
+        self.egg_weights = tuple(sorted(set(egg_weights)))
+        # eggs[w] is the fewest eggs weighing w, last_egg[w] the weight of
+        # one egg of such a composition
+        self.eggs = array('i', [0])
+        self.last_egg = array('i', [0])
+        heaviest = self.egg_weights[-1]
+        self.reduce_above = (heaviest - 1) * (sum(self.egg_weights) -
+                                              heaviest)
+        # Whether greedy is optimal, found on the first query
+        self.canonical = None
+
+    def is_canonical(self):
+        """
+        Returns True if taking the heaviest egg that fits, repeatedly,
+        always uses the fewest eggs. By Kozen and Zaks, a weight where
+        greedy is not optimal, if any, is below the sum of the two
+        heaviest eggs, so only those weights are checked.
+        """
+        if self.canonical is None:
+            if self.egg_weights[0] != 1:
+                self.canonical = False
+            elif len(self.egg_weights) < 3:
+                self.canonical = True
+            else:
+                below = self.egg_weights[-1] + self.egg_weights[-2]
+                self.extend(below - 1)
+                self.canonical = all(
+                    sum(self._greedy(weight).values()) == self.eggs[weight]
+                    for weight in range(below))
+        return self.canonical
+
+    def _greedy(self, target_weight):
+        composition = {}
+        for egg in reversed(self.egg_weights):
+            if target_weight >= egg:
+                composition[egg], target_weight = divmod(target_weight, egg)
+        return composition
+
+    def get_size(self):
+        """Returns the largest weight in the table."""
+        return len(self.eggs) - 1
+
+    def extend(self, target_weight):
+        """Fills the table up to target_weight, with array operations if
+        NumPy is installed and there are enough new weights."""
+        start = len(self.eggs)
+        if target_weight < start:
+            return
+        if numpy is not None and target_weight - start >= NUMPY_MIN_WEIGHTS:
+            self._append(*self._fill_numpy(start, target_weight))
+        else:
+            self._append(*self._fill(start, target_weight))
+
+    def _fill(self, start, target_weight):
+        """
+        Returns a tuple of arrays (eggs, last_egg) for the weights from
+        start to target_weight, the table being filled below start.
+        """
+        eggs = self.eggs
+        new_eggs = array('i')
+        new_last_egg = array('i')
+        for weight in range(start, target_weight + 1):
+            best = UNREACHABLE
+            best_egg = 0
+            for egg in self.egg_weights:
+                if egg > weight:
+                    break
+                before = weight - egg
+                if before < start:
+                    count = eggs[before]
+                else:
+                    count = new_eggs[before - start]
+                if count != UNREACHABLE and (best == UNREACHABLE or
+                                             count + 1 < best):
+                    best = count + 1
+                    best_egg = egg
+            new_eggs.append(best)
+            new_last_egg.append(best_egg)
+        return new_eggs, new_last_egg
+
+    def _fill_numpy(self, start, target_weight):
+        """
+        Like _fill, but each egg is one vectorised pass. Laid out in rows
+        of egg weights, a column holds the weights one egg apart, and
+        allowing any number of that egg is a running minimum down the
+        column of count - row, plus row. The table below start is final,
+        so only its last heaviest weights are read. The last egg is the
+        lightest one leaving a weight with one egg less, as in _fill.
+        """
+        offset = max(0, start - self.egg_weights[-1])
+        known = start - offset
+        size = target_weight + 1 - offset
+        # Any count is at most the weight, so this marks unreachable ones
+        unreachable = target_weight + 1
+        counts = numpy.full(size, unreachable, dtype=numpy.int64)
+        counts[:known] = numpy.array(self.eggs[offset:start],
+                                     dtype=numpy.int64)
+        counts[:known][counts[:known] == UNREACHABLE] = unreachable
+        for egg in self.egg_weights:
+            rows = -(-size // egg)
+            grid = numpy.full(rows * egg, unreachable, dtype=numpy.int64)
+            grid[:size] = counts
+            grid = grid.reshape(rows, egg)
+            row = numpy.arange(rows, dtype=numpy.int64).reshape(rows, 1)
+            grid -= row
+            numpy.minimum.accumulate(grid, axis=0, out=grid)
+            grid += row
+            numpy.minimum(counts, grid.ravel()[:size], out=counts)
+        last_egg = numpy.zeros(size, dtype=numpy.intc)
+        for egg in reversed(self.egg_weights):
+            low = max(known, egg)
+            if low < size:
+                last_egg[low:][counts[low - egg:size - egg] + 1 ==
+                               counts[low:]] = egg
+        counts = counts[known:]
+        counts[counts == unreachable] = UNREACHABLE
+        return (array('i', counts.astype(numpy.intc).tobytes()),
+                array('i', last_egg[known:].tobytes()))
+
+    def _append(self, new_eggs, new_last_egg):
+        self.eggs.extend(new_eggs)
+        self.last_egg.extend(new_last_egg)
+
+    def get_eggs(self, target_weight):
+        """
+        Returns the fewest eggs weighing target_weight, extending the
+        table if needed: one table read, with no composition built.
+        Raises a ValueError if no eggs weigh exactly target_weight.
+        """
+        if self.is_canonical():
+            count = 0
+            for egg in reversed(self.egg_weights):
+                eggs, target_weight = divmod(target_weight, egg)
+                count += eggs
+            return count
+        heaviest_count, rest = self._reduce(target_weight)
+        return heaviest_count + self.eggs[rest]
+
+    def _reduce(self, target_weight):
+        """
+        Returns a tuple (count, rest): count of the heaviest egg always
+        used for target_weight, and rest the weight left, which the
+        table is extended to. Raises a ValueError if no eggs weigh
+        exactly target_weight.
+        """
+        heaviest = self.egg_weights[-1]
+        count = 0
+        rest = target_weight
+        if rest > self.reduce_above:
+            count = -(-(rest - self.reduce_above) // heaviest)
+            rest -= count * heaviest
+        if rest >= 0:
+            self.extend(rest)
+        if rest < 0 or self.eggs[rest] == UNREACHABLE:
+            raise ValueError("No eggs weigh {}.".format(target_weight))
+        return count, rest
+
+    def get_composition(self, target_weight):
+        """
+        Returns a dictionary of egg weight (int), count (int) pairs of a
+        composition of target_weight with the fewest eggs. Raises a
+        ValueError if no eggs weigh exactly target_weight.
+        """
+        if self.is_canonical():
+            return self._greedy(target_weight)
+        composition = {}
+        heaviest_count, rest = self._reduce(target_weight)
+        if heaviest_count:
+            composition[self.egg_weights[-1]] = heaviest_count
+        while rest:
+            egg = self.last_egg[rest]
+            composition[egg] = composition.get(egg, 0) + 1
+            rest -= egg
+        return composition
+
+class MappedEggTable(EggTable):
+    """An EggTable kept in two files of native 32-bit integers, one per
+    column, that are memory mapped. Lookups read the mapped pages
+    directly, and extending the table appends to the files, so the work
+    of earlier runs is never redone. Opening a table maps its files; the
+    first query also runs the greedy check of is_canonical, which fills
+    the table below the sum of the two heaviest eggs if no earlier run
+    did.
+
+    Tables of the same egg weights, in this process or others, may share
+    the files. Changes to them hold an exclusive lock (fcntl.flock, where
+    available) on a third file, and extending first maps the files again
+    so that only weights beyond those already on disk are filled."""
+    def __init__(self, egg_weights, directory):
+        EggTable.__init__(self, egg_weights)
+        name = "eggs_" + "_".join(str(egg) for egg in self.egg_weights)
+        self.filenames = (os.path.join(directory, name + ".count"),
+                          os.path.join(directory, name + ".last"))
+        self.lock_filename = os.path.join(directory, name + ".lock")
+        self.maps = []
+        with self._locked():
+            self._recover()
+            self._map()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.lock_filename, "ab") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _recover(self):
+        itemsize = array('i').itemsize
+        if all(os.path.exists(filename) for filename in self.filenames):
+            # A run stopped between the two appends leaves one file longer
+            size = min(os.path.getsize(filename)
+                       for filename in self.filenames)
+            size -= size % itemsize
+            for filename in self.filenames:
+                if os.path.getsize(filename) != size:
+                    os.truncate(filename, size)
+        else:
+            size = 0
+        if size == 0:
+            for filename in self.filenames:
+                with open(filename, "wb") as file:
+                    array('i', [0]).tofile(file)
+
+    def _map(self):
+        self._unmap()
+        for filename in self.filenames:
+            with open(filename, "rb") as file:
+                self.maps.append(mmap.mmap(file.fileno(), 0,
+                                           access=mmap.ACCESS_READ))
+        self.eggs, self.last_egg = [memoryview(table_map).cast('i')
+                                    for table_map in self.maps]
+
+    def _unmap(self):
+        if self.maps:
+            self.eggs.release()
+            self.last_egg.release()
+            for table_map in self.maps:
+                table_map.close()
+            self.maps = []
+
+    def extend(self, target_weight):
+        if target_weight < len(self.eggs):
+            return
+        with self._locked():
+            # Another table may have extended the files since they were
+            # mapped, or stopped between the two appends
+            self._recover()
+            self._map()
+            EggTable.extend(self, target_weight)
+
+    def _append(self, new_eggs, new_last_egg):
+        # The counts go last: a weight is only in the table once both
+        # files hold it
+        for filename, column in zip(self.filenames[::-1],
+                                    (new_last_egg, new_eggs)):
+            with open(filename, "ab") as file:
+                column.tofile(file)
+        self._map()
+
+    def close(self):
+        """Unmaps the files. The table cannot be used afterwards."""
+        self._unmap()
+
+# dict of egg weights (sorted tuple) -> EggTable shared by all calls
+_egg_tables = {}
+# dict of (directory, egg weights) -> MappedEggTable shared by all calls
+_mapped_egg_tables = {}
+
+def get_egg_table(egg_weights, memo=None, directory=None):
+    """
+    Returns the EggTable of a set of egg weights, creating it if needed.
+    Tables are kept per set of weights, so answers for different weights
+    never mix.
+
+    Parameters:
+    egg_weights - iterable of ints, available egg weights in any order
+    memo - dictionary of sorted egg weights tuple -> EggTable, OPTIONAL.
+    Defaults to a cache shared by all calls.
+    directory - string, OPTIONAL. If given, the table is a MappedEggTable
+    stored in this directory, which keeps it across runs.
+    """
+    key = tuple(sorted(set(egg_weights)))
+    if directory is not None:
+        if memo is None:
+            memo = _mapped_egg_tables
+        if (directory, key) not in memo:
+            memo[(directory, key)] = MappedEggTable(key, directory)
+        return memo[(directory, key)]
+    if memo is None:
+        memo = _egg_tables
+    if key not in memo:
+        memo[key] = EggTable(key)
+    return memo[key]
+
+def dp_make_weight(egg_weights, target_weight, memo = None,
+                   directory = None):
     """
     Find number of eggs to bring back, using the smallest number of
     eggs. Assumes there is an infinite supply of eggs of each weight,
     and there is always a egg of value 1.
-    
+
     Parameters:
     egg_weights - tuple of integers, available egg weights sorted
     descending
     target_weight - int, amount of weight we want to find eggs to fit
-    memo - dictionary, OPTIONAL parameter for memoization (you may not
-    need to use this parameter depending on your implementation)
-    
+    memo - dictionary, OPTIONAL cache of EggTable per set of egg weights
+    (see get_egg_table)
+    directory - string, OPTIONAL directory keeping the table on disk
+    between runs (see MappedEggTable)
+
     Returns: int, smallest number of eggs needed to make target weight
     """
-    if target_weight == 0:
-        return memo[0]
-    try:
-        return memo[target_weight]
-    except KeyError:
-        result = []
-        for egg in egg_weights:
-            new_target_weight = target_weight - egg
-            if new_target_weight >= 0:
-                result.append(1 + dp_make_weight(egg_weights,
-                                                 new_target_weight))
-        memo[target_weight] = min(result)
-        return memo[target_weight]
+    return get_egg_table(egg_weights, memo,
+                         directory).get_eggs(target_weight)
+
+def dp_make_weights(egg_weights, target_weights, memo = None,
+                    directory = None):
+    """
+    Answers dp_make_weight for many target weights from one table, which
+    is only filled as far as the largest of them needs.
+
+    Returns: list of ints, smallest number of eggs needed to make each
+    target weight
+    """
+    table = get_egg_table(egg_weights, memo, directory)
+    return [table.get_eggs(weight) for weight in target_weights]
+
+def dp_make_composition(egg_weights, target_weight, memo = None,
+                        directory = None):
+    """
+    Like dp_make_weight, but returns which eggs to bring back.
+
+    Returns: dictionary of egg weight (int), count (int) pairs using the
+    smallest number of eggs to make target weight
+    """
+    return get_egg_table(egg_weights, memo,
+                         directory).get_composition(target_weight)
+
+# Begin tests
+def plain_fewest_eggs(egg_weights, target_weight):
+    """Returns the fewest eggs weighing each weight up to target_weight,
+    None where no eggs weigh it, from a plain list DP."""
+    fewest = [0] + [None] * target_weight
+    for weight in range(1, target_weight + 1):
+        counts = [fewest[weight - egg] for egg in egg_weights
+                  if egg <= weight and fewest[weight - egg] is not None]
+        if counts:
+            fewest[weight] = min(counts) + 1
+    return fewest
+
+class TestEggTable(unittest.TestCase):
+    EGG_WEIGHTS = [(1, 5, 10, 25), (1, 3, 4), (1, 7, 23, 61, 199), (3, 7),
+                   (4, 3), (6, 10, 15), (1,)]
+
+    def check_weight(self, table, weight, fewest):
+        if fewest is None:
+            with self.assertRaises(ValueError):
+                table.get_eggs(weight)
+            with self.assertRaises(ValueError):
+                table.get_composition(weight)
+            return
+        composition = table.get_composition(weight)
+        self.assertEqual(table.get_eggs(weight), fewest)
+        self.assertEqual(sum(composition.values()), fewest)
+        self.assertEqual(sum(egg * count
+                             for egg, count in composition.items()), weight)
+        self.assertTrue(set(composition) <= set(table.egg_weights))
+
+    def test_matches_plain_dp(self):
+        for egg_weights in self.EGG_WEIGHTS:
+            table = EggTable(egg_weights)
+            fewest = plain_fewest_eggs(egg_weights, 600)
+            for weight in range(601):
+                self.check_weight(table, weight, fewest[weight])
+
+    def test_canonical(self):
+        table = EggTable((25, 10, 5, 1))
+        self.assertTrue(table.is_canonical())
+        self.assertEqual(table.get_eggs(10 ** 9 + 99), 4 * 10 ** 7 + 9)
+        # Only the weights below 25 + 10 were checked
+        self.assertEqual(table.get_size(), 34)
+        self.assertFalse(EggTable((1, 3, 4)).is_canonical())
+        self.assertFalse(EggTable((3, 7)).is_canonical())
+
+    def test_reduce_above(self):
+        egg_weights = (1, 7, 23, 61, 199)
+        table = EggTable(egg_weights)
+        self.assertFalse(table.is_canonical())
+        self.assertEqual(table.reduce_above, 198 * 92)
+        fewest = plain_fewest_eggs(egg_weights, table.reduce_above + 1000)
+        for weight in range(table.reduce_above - 200, len(fewest), 7):
+            self.check_weight(table, weight, fewest[weight])
+        self.assertLessEqual(table.get_size(), table.reduce_above)
+        table.get_eggs(10 ** 12)
+        self.assertLessEqual(table.get_size(), table.reduce_above)
+
+    def test_large_targets(self):
+        for egg_weights in self.EGG_WEIGHTS:
+            table = EggTable(egg_weights)
+            for weight in range(10 ** 7, 10 ** 7 + 2000, 37):
+                try:
+                    composition = table.get_composition(weight)
+                except ValueError:
+                    with self.assertRaises(ValueError):
+                        table.get_eggs(weight)
+                    continue
+                self.assertEqual(table.get_eggs(weight),
+                                 sum(composition.values()))
+                self.assertEqual(sum(egg * count for egg, count
+                                     in composition.items()), weight)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_kernel(self):
+        for egg_weights in self.EGG_WEIGHTS + [(2, 9, 31, 32), (5, 8)]:
+            expected = EggTable(egg_weights)
+            expected._append(*expected._fill(1, 1500))
+            for start in (1, 2, 31, 200, 1500):
+                table = EggTable(egg_weights)
+                if start > 1:
+                    table._append(*table._fill(1, start - 1))
+                eggs, last_egg = table._fill_numpy(start, 1500)
+                self.assertEqual(list(eggs), list(expected.eggs[start:]))
+                self.assertEqual(list(last_egg),
+                                 list(expected.last_egg[start:]))
+
+    def test_unreachable(self):
+        table = EggTable((4, 3))
+        for weight in (1, 2, 5):
+            with self.assertRaises(ValueError):
+                table.get_eggs(weight)
+            with self.assertRaises(ValueError):
+                table.get_composition(weight)
+        self.assertEqual(table.get_composition(6), {3: 2})
+        self.assertEqual(dp_make_weight((4, 3), 10 ** 6 + 1, {}), 250001)
+
+class TestMappedEggTable(unittest.TestCase):
+    EGG_WEIGHTS = (1, 7, 23, 61, 199)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_survives_restart_and_extends(self):
+        table = MappedEggTable(self.EGG_WEIGHTS, self.directory)
+        self.assertEqual(table.get_eggs(500), EggTable(
+            self.EGG_WEIGHTS).get_eggs(500))
+        size = table.get_size()
+        table.close()
+        # A new process would only map the files
+        table = MappedEggTable(self.EGG_WEIGHTS, self.directory)
+        self.assertEqual(table.get_size(), size)
+        table.extend(5000)
+        table.close()
+        table = MappedEggTable(self.EGG_WEIGHTS, self.directory)
+        expected = EggTable(self.EGG_WEIGHTS)
+        expected.extend(5000)
+        self.assertEqual(table.get_size(), 5000)
+        self.assertEqual(list(table.eggs), list(expected.eggs))
+        self.assertEqual(list(table.last_egg), list(expected.last_egg))
+        table.close()
+
+    def test_interrupted_append(self):
+        table = MappedEggTable(self.EGG_WEIGHTS, self.directory)
+        table.extend(300)
+        table.close()
+        with open(table.filenames[1], "ab") as file:
+            array('i', [7, 7]).tofile(file)
+        table = MappedEggTable(self.EGG_WEIGHTS, self.directory)
+        self.assertEqual(table.get_size(), 300)
+        self.assertEqual(table.get_composition(12345),
+                         EggTable(self.EGG_WEIGHTS).get_composition(12345))
+        table.close()
+
+    def test_two_open_tables(self):
+        first = MappedEggTable(self.EGG_WEIGHTS, self.directory)
+        second = MappedEggTable(self.EGG_WEIGHTS, self.directory)
+        first.extend(1000)
+        # The second table finds the weights already on disk
+        second.extend(500)
+        self.assertEqual(second.get_size(), 1000)
+        second.extend(3000)
+        self.assertEqual(first.get_eggs(2500), second.get_eggs(2500))
+        self.assertEqual(first.get_size(), 3000)
+        expected = EggTable(self.EGG_WEIGHTS)
+        expected.extend(3000)
+        for filename in first.filenames:
+            self.assertEqual(os.path.getsize(filename),
+                             3001 * array('i').itemsize)
+        for table in (first, second):
+            self.assertEqual(list(table.eggs), list(expected.eggs))
+            self.assertEqual(list(table.last_egg), list(expected.last_egg))
+            table.close()
+
+    def test_tables_per_egg_weights(self):
+        memo = {}
+        self.assertEqual(dp_make_weight((25, 10, 5, 1), 99, memo,
+                                        self.directory), 9)
+        self.assertEqual(dp_make_weight((4, 3, 1), 6, memo,
+                                        self.directory), 2)
+        # Two columns and a lock file per table
+        self.assertEqual(len(os.listdir(self.directory)), 6)
+        for table in memo.values():
+            table.close()
 
 if __name__ == '__main__':
     egg_weights = (1, 5, 10, 25)
@@ -36,4 +549,5 @@ if __name__ == '__main__':
     print("n = 99")
     print("Expected ouput: 9 (3 * 25 + 2 * 10 + 4 * 1 = 99)")
     print("Actual output:", dp_make_weight(egg_weights, n))
-    print()
\ No newline at end of file
+    print("Eggs:", dp_make_composition(egg_weights, n))
+    print()